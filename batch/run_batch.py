@@ -0,0 +1,234 @@
+"""Headless TIME_SERIES_FILTERS runs over CSV and Parquet files.
+
+Runs tsf_wrapper.execute() through the local host adapter in host/, outside of SPSS Statistics.
+Each input file is one run on a pool of worker processes. Only the columns named in the settings
+are read, by column, and the saved trend and cycle variables of the file are written as a
+columnar file, next to a JSON file with the notes and warnings of the run.
+
+    python batch/run_batch.py --settings settings.json --time DATE --output-dir out \\
+        [--format parquet|csv|npz] [--workers 8] [--charts] [--summary summary.json] data/*.parquet
+
+The settings file maps property ids of TSF-properties.json to values, for example
+{"hpfilter": true, "hpvariable": ["gdp"], "bkfilter": true, "bk_cf_variables": ["gdp", "cpi"]}.
+Trend and cycle are both saved unless the settings set "save_trend" or "save_cycle" to false; these two
+keys are read by the batch runner only. The panel_variable column is read as text labels, like the time
+column, and is written next to them in the saved file. Charts are skipped unless --charts is given and
+every run filters on a single thread unless the settings set filter_threads.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BATCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BATCH)
+sys.path[:0] = [os.path.join(ROOT, "host"), os.path.join(ROOT, "src")]
+
+import tsf_wrapper  # noqa: E402
+from wrapper import basewrapper  # noqa: E402
+
+PARQUET_SUFFIXES = (".parquet", ".pq")
+OUTPUT_FORMATS = ("parquet", "csv", "npz")
+
+
+def referenced_columns(settings):
+    # The variables the extension filters, as in get_referenced_variables
+    names = []
+    for key in ("hpvariable", "bk_cf_variables"):
+        value = settings.get(key) or []
+        names.extend([value] if isinstance(value, str) else value)
+    return list(dict.fromkeys(names))
+
+
+def panel_label(value):
+    # Panel ids are labels like the time column; a missing id stays None so the row joins no group
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value == "":
+        return None
+    return str(value)
+
+
+def read_columns(path, names, time_column=None, panel_column=None):
+    # Returns {name: column}: float64 arrays for the variables, strings for the time and panel labels
+    labels = [name for name in (time_column, panel_column) if name and name not in names]
+    wanted = names + list(dict.fromkeys(labels))
+    if path.lower().endswith(PARQUET_SUFFIXES):
+        import pyarrow.parquet as pq
+        return table_columns(pq.read_table(path, columns=wanted), names, time_column, panel_column)
+
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        return read_csv_columns(path, names, time_column, panel_column)
+    # The panel column is read as text, so ids such as "SW" or "007" are kept as they are written
+    column_types = {panel_column: pa.string()} if panel_column else {}
+    table = pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(include_columns=wanted,
+                                                                        column_types=column_types))
+    return table_columns(table, names, time_column, panel_column)
+
+
+def table_columns(table, names, time_column, panel_column=None):
+    columns = {name: np.asarray(table.column(name).to_numpy(zero_copy_only=False), dtype=np.float64)
+               for name in names}
+    if time_column:
+        columns[time_column] = [str(value) for value in table.column(time_column).to_pylist()]
+    if panel_column:
+        columns[panel_column] = [panel_label(value) for value in table.column(panel_column).to_pylist()]
+    return columns
+
+
+def read_csv_columns(path, names, time_column, panel_column=None):
+    # Without pyarrow the file is read with the csv module, still one list per wanted column
+    labels = [name for name in (time_column, panel_column) if name]
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        missing = [name for name in names + labels if name not in header]
+        if missing:
+            raise KeyError(f"{path} has no column {', '.join(missing)}")
+        wanted = {name: header.index(name) for name in names + labels}
+        values = {name: [] for name in wanted}
+        for row in reader:
+            for name, index in wanted.items():
+                values[name].append(row[index])
+
+    columns = {name: np.array([float(value) if value.strip() else np.nan for value in values[name]])
+               for name in names}
+    if time_column:
+        columns[time_column] = values[time_column]
+    if panel_column:
+        columns[panel_column] = [panel_label(value.strip()) for value in values[panel_column]]
+    return columns
+
+
+def write_columns(path, output_format, columns):
+    if output_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.table(columns), path)
+    elif output_format == "npz":
+        np.savez(path, **columns)
+    else:
+        names = list(columns)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(names)
+            for row in zip(*(columns[name] for name in names)):
+                writer.writerow(["" if isinstance(value, float) and np.isnan(value) else value for value in row])
+
+
+def run_settings(settings, charts):
+    # Returns the extension settings and the parts of each filter result to save
+    run = {"no_plots": not charts, "filter_threads": 1}
+    run.update(settings)
+    run["factors"] = None
+    save_parts = tuple(part for part in ("trend", "cycle") if run.pop(f"save_{part}", True))
+    return run, save_parts
+
+
+def run_file(task):
+    # Runs in a worker process; the host adapter keeps the state of one run at a time
+    path, settings, options = task
+    start = time.perf_counter()
+    summary = {"file": path}
+    try:
+        names = referenced_columns(settings)
+        time_column = options["time"]
+        panel_column = settings.get("panel_variable") or None
+        columns = read_columns(path, names, time_column, panel_column)
+        rows = len(columns[names[0]]) if names else 0
+        labels = columns[time_column] if time_column else [str(i + 1) for i in range(rows)]
+
+        # The variables keep their names, the time labels become the DATE_ field and the panel ids
+        # are passed as a label field under their own name
+        fields = [{"name": name} for name in names] + [{"name": "DATE_"}]
+        data = [columns[name] for name in names] + [labels]
+        if panel_column:
+            fields.append({"name": panel_column})
+            data.append(columns[panel_column])
+        data_model = {"fields": fields, "columns": data}
+        basewrapper.outputs.clear()
+        saved_variables = []
+        run, save_parts = run_settings(settings, options["charts"])
+        tsf_wrapper.execute(0, data_model, run, save_output=saved_variables.append, save_parts=save_parts)
+        report = basewrapper.outputs[-1][0]
+        output_data = saved_variables[-1] if saved_variables else None
+
+        stem = os.path.splitext(os.path.basename(path))[0]
+        with open(os.path.join(options["output_dir"], stem + ".json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+        if output_data is not None:
+            saved = {time_column or "DATE_": labels} if options["format"] != "npz" else \
+                {time_column or "DATE_": np.asarray(labels)}
+            if panel_column:
+                saved[panel_column] = columns[panel_column] if options["format"] != "npz" else \
+                    np.asarray(["" if value is None else value for value in columns[panel_column]])
+            saved.update((field["name"], np.asarray(output_data["data"][:, i]))
+                         for i, field in enumerate(output_data["fields"]))
+            output_path = os.path.join(options["output_dir"], f"{stem}.{options['format']}")
+            write_columns(output_path, options["format"], saved)
+            summary["output"] = output_path
+            summary["variables"] = len(output_data["fields"])
+
+        summary["rows"] = rows
+        summary["warnings"] = [item["text"] for item in report["items"] if item["type"] == "warnings"]
+    except Exception as err:
+        summary["error"] = repr(err)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="+", help="CSV or Parquet input files")
+    parser.add_argument("--settings", required=True, help="JSON file of property ids and values")
+    parser.add_argument("--time", help="column with the time labels, row numbers are used without it")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="parquet")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes, 0 for one per CPU")
+    parser.add_argument("--charts", action="store_true", help="keep the chart specifications in the JSON files")
+    parser.add_argument("--summary", help="write the per file results to this JSON file")
+    args = parser.parse_args()
+
+    with open(args.settings, encoding="utf-8") as f:
+        settings = json.load(f)
+    os.makedirs(args.output_dir, exist_ok=True)
+    options = {"time": args.time, "output_dir": args.output_dir, "format": args.format, "charts": args.charts}
+    tasks = [(path, settings, options) for path in args.files]
+
+    workers = args.workers if args.workers > 0 else os.cpu_count() or 1
+    workers = min(workers, len(tasks))
+    start = time.perf_counter()
+    if workers <= 1:
+        results = map(run_file, tasks)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(run_file, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+
+    summaries = []
+    for summary in results:
+        summaries.append(summary)
+        problem = summary.get("error") or "; ".join(summary.get("warnings", []))
+        status = f"failed: {problem}" if problem else f"{summary['rows']} rows, {summary.get('variables', 0)} saved"
+        print(f"{summary['file']}: {status} ({summary['seconds']:.3f} s)")
+    if workers > 1:
+        executor.shutdown()
+
+    failed = sum(1 for summary in summaries if summary.get("error") or summary.get("warnings"))
+    print(f"{len(summaries)} files in {time.perf_counter() - start:.2f} s on {workers} workers, {failed} failed")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump({"workers": workers, "files": summaries}, f, indent=2)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
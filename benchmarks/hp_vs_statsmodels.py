@@ -0,0 +1,69 @@
+"""Wall-clock time of the HP engine against statsmodels' hpfilter on the same columns.
+
+The engine factors the banded system once for all columns; statsmodels solves a sparse system per
+column. The results are compared by tests/test_engines.py, this script only times them.
+
+    python benchmarks/hp_vs_statsmodels.py [--points 20000] [--variables 10] [--repeat 3] [--output hp.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS), "src"))
+
+import tsf_engines  # noqa: E402
+
+
+def best_time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--variables", type=int, default=10)
+    parser.add_argument("--lamb", type=float, default=1600)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        import statsmodels.api as sm
+    except ImportError:
+        sys.exit("statsmodels is not installed")
+
+    x = np.random.default_rng(0).normal(size=(args.points, args.variables)).cumsum(axis=0)
+    # Loads scipy before the timed runs
+    tsf_engines.hp_filter_engine(x[:10], args.lamb)
+
+    def engine():
+        tsf_engines._hp_factor_cache.clear()
+        tsf_engines.hp_filter_engine(x, args.lamb)
+
+    engine_seconds = best_time(engine, args.repeat)
+    statsmodels_seconds = best_time(lambda: [sm.tsa.filters.hpfilter(x[:, i], args.lamb)
+                                             for i in range(args.variables)], args.repeat)
+    print(f"{args.points} points x {args.variables} variables, lambda {args.lamb:g}")
+    print(f"tsf_engines  {engine_seconds:8.4f} s")
+    print(f"statsmodels  {statsmodels_seconds:8.4f} s  ({statsmodels_seconds / engine_seconds:.1f}x)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"points": args.points, "variables": args.variables, "lambda": args.lamb,
+                       "repeat": args.repeat, "engine_seconds": engine_seconds,
+                       "statsmodels_seconds": statsmodels_seconds}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Import time of the extension and of the modules it used to load eagerly.
+
+Every measurement runs in a fresh interpreter so nothing is already in sys.modules.
+
+    python benchmarks/import_time.py [--repeat 5] [--output import_time.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(BENCHMARKS), "src")
+HOST = os.path.join(os.path.dirname(BENCHMARKS), "host")
+
+TIMED_IMPORT = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+heavy = sorted(name for name in ("scipy", "statsmodels", "pandas", "patsy") if name in sys.modules)
+print(json.dumps([elapsed, heavy]))
+"""
+
+# A run without a date variable stops in execute() before any data is read
+EARLY_EXIT = """
+import tsf_wrapper
+tsf_wrapper.execute(0, {"fields": [{"name": "y"}], "records": []}, {})
+"""
+
+CASES = {
+    "tsf_wrapper": "import tsf_wrapper",
+    "tsf_wrapper early exit": EARLY_EXIT,
+    "numpy": "import numpy",
+    "scipy.linalg": "import scipy.linalg",
+    "scipy.signal": "import scipy.signal",
+    "statsmodels.api": "import statsmodels.api",
+}
+
+
+def time_import(statement):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([HOST, SRC]))
+    code = TIMED_IMPORT.format(statement=statement.strip())
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1]
+    elapsed, heavy = json.loads(result.stdout.strip().splitlines()[-1])
+    return elapsed, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    for name, statement in CASES.items():
+        timings = []
+        for _ in range(args.repeat):
+            elapsed, detail = time_import(statement)
+            if elapsed is None:
+                break
+            timings.append(elapsed)
+        if not timings:
+            print(f"{name:<24} not available ({detail})")
+            continue
+        results[name] = {"median_seconds": statistics.median(timings), "min_seconds": min(timings),
+                         "heavy_modules_loaded": detail}
+        print(f"{name:<24} {statistics.median(timings):8.3f} s  heavy modules: {', '.join(detail) or 'none'}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "repeat": args.repeat, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
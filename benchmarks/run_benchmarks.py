@@ -0,0 +1,252 @@
+"""End to end benchmark of TIME_SERIES_FILTERS on synthetic series.
+
+Drives tsf_wrapper.execute() through the host stand-ins in host/ for every
+combination of series length and variable count, times each stage and writes the results
+as JSON. Passing a previous result file with --compare reports the stages that got slower.
+
+    python benchmarks/run_benchmarks.py --points 100,10000,1000000 --variables 1,10,100 \\
+        --output results.json [--compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+from scipy.signal import lfilter
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(BENCHMARKS), "src")
+sys.path[:0] = [os.path.join(os.path.dirname(BENCHMARKS), "host"), SRC]
+
+import tsf_wrapper  # noqa: E402
+from wrapper import basewrapper  # noqa: E402
+
+WEEKDAYS = ["SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT"]
+
+# Stage name -> functions of tsf_wrapper whose time is charged to that stage
+STAGES = {
+    "ingest": ["ColumnStream.append", "ColumnStream.get_columns", "ColumnProjection.decode"],
+    "date parsing": ["parse_and_sort_factors"],
+    "hp filter": ["hp_filter_engine", "hp_onesided_engine", "hp_sweep_engine"],
+    "bk filter": ["bk_filter_engine"],
+    "cf filter": ["cf_filter_engine"],
+    "hamilton filter": ["hamilton_filter_engine"],
+    "chart build": ["create_hp_filter_output", "create_hamilton_filter_output",
+                    "create_bk_filter_output", "create_cf_filter_output",
+                    "create_bk_cf_variable_time_series_plot", "ChartBuilder.finish"],
+}
+
+
+def trend_cycle_series(n, k, rng):
+    # Random walk trend with drift plus an AR(2) cycle of period about 20 and white noise
+    trend = np.cumsum(0.05 + 0.2 * rng.standard_normal((n, k)), axis=0)
+    cycle = lfilter([1.0], [1.0, -2 * 0.9 * np.cos(2 * np.pi / 20), 0.81], rng.standard_normal((n, k)), axis=0)
+    return trend + cycle + 0.5 * rng.standard_normal((n, k))
+
+
+def ar_series(n, k, rng, phi=0.8):
+    return lfilter([1.0], [1.0, -phi], rng.standard_normal((n, k)), axis=0)
+
+
+GENERATORS = {"trend_cycle": trend_cycle_series, "ar": ar_series}
+
+
+def date_factors(n):
+    # Weekday/number factor levels, the only built-in format that does not run out of dates
+    return [f"[DATE_={WEEKDAYS[i % 7]} {i // 7 + 1}]" for i in range(n)]
+
+
+def make_case(n, k, generator, seed):
+    data = GENERATORS[generator](n, k, np.random.default_rng(seed))
+    names = [f"y{j}" for j in range(k)]
+    fields = [{"name": name} for name in names]
+    records = data.tolist()
+    settings = {"factors": date_factors(n), "hpfilter": True, "hamiltonfilter": True, "hpvariable": names,
+                "bkfilter": True, "cffilter": True, "bk_cf_variables": names}
+    return {"fields": fields, "records": records}, settings
+
+
+class StageTimer:
+    """Wraps tsf_wrapper functions so their wall time is added to a named stage"""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        # Filters may run on worker threads, so nesting is tracked per thread
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.originals = []
+
+    def wrap(self, stage, owner, name):
+        original = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            # Nested timed calls are charged to the outer stage only
+            if getattr(self.local, "active", False):
+                return original(*args, **kwargs)
+            self.local.active = True
+            start = time.perf_counter()
+            try:
+                result = original(*args, **kwargs)
+                if hasattr(result, "__next__"):
+                    result = list(result)
+                return result
+            finally:
+                with self.lock:
+                    self.seconds[stage] += time.perf_counter() - start
+                self.local.active = False
+
+        self.originals.append((owner, name, original))
+        setattr(owner, name, timed)
+
+    def install(self):
+        for stage, targets in STAGES.items():
+            for target in targets:
+                owner = tsf_wrapper
+                *path, name = target.split(".")
+                for part in path:
+                    owner = getattr(owner, part)
+                self.wrap(stage, owner, name)
+
+        def serialize(output_json, output_data):
+            start = time.perf_counter()
+            text = json.dumps(output_json)
+            self.seconds["json serialization"] += time.perf_counter() - start
+            self.output_bytes = len(text)
+            basewrapper.outputs.append((output_json, output_data))
+
+        self.originals.append((tsf_wrapper, "generate_output", tsf_wrapper.generate_output))
+        tsf_wrapper.generate_output = serialize
+
+    def uninstall(self):
+        for owner, name, original in reversed(self.originals):
+            setattr(owner, name, original)
+        self.originals.clear()
+
+
+def run_case(data_model, settings, trace_memory):
+    basewrapper.outputs.clear()
+    timer = StageTimer()
+    timer.install()
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        tsf_wrapper.execute(0, data_model, settings)
+        total = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        timer.uninstall()
+
+    output_json = basewrapper.outputs[-1][0] if basewrapper.outputs else {"items": []}
+    warnings = [item["text"] for item in output_json["items"] if item["type"] == "warnings"]
+    if warnings:
+        raise RuntimeError(warnings[0])
+    stages = dict(timer.seconds)
+    stages["other"] = max(total - sum(stages.values()), 0.0)
+    return {"total": total, "stages": stages, "peak_bytes": peak,
+            "output_bytes": getattr(timer, "output_bytes", 0)}
+
+
+def summarize(runs):
+    stages = sorted({stage for run in runs for stage in run["stages"]})
+    return {"total_seconds": statistics.median(run["total"] for run in runs),
+            "stages_seconds": {stage: statistics.median(run["stages"].get(stage, 0.0) for run in runs)
+                               for stage in stages},
+            "output_bytes": runs[-1]["output_bytes"]}
+
+
+def compare(results, baseline_path, tolerance, floor):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(case["points"], case["variables"], case["generator"]): case for case in json.load(f)["cases"]}
+
+    regressions = []
+    for case in results["cases"]:
+        old = baseline.get((case["points"], case["variables"], case["generator"]))
+        if old is None:
+            continue
+        pairs = [("total", old["total_seconds"], case["total_seconds"])]
+        pairs += [(stage, old["stages_seconds"].get(stage, 0.0), seconds)
+                  for stage, seconds in case["stages_seconds"].items()]
+        for stage, before, after in pairs:
+            # Stages that take less than the floor are too noisy to compare
+            if after > floor and after > before * tolerance:
+                regressions.append((case["points"], case["variables"], stage, before, after))
+
+    for points, variables, stage, before, after in regressions:
+        print(f"slower: {points} points x {variables} variables, {stage}: {before:.4f} s -> {after:.4f} s")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def int_list(text):
+    return [int(float(value)) for value in text.split(",") if value]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int_list, default=[100, 10000, 1000000])
+    parser.add_argument("--variables", type=int_list, default=[1, 10, 100])
+    parser.add_argument("--generator", choices=sorted(GENERATORS), default="trend_cycle")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-cells", type=float, default=2e7,
+                        help="skip cases with more points x variables, the host records are Python lists")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="previous result file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="slowdown ratio reported by --compare")
+    parser.add_argument("--floor", type=float, default=0.005, help="ignore stages faster than this in --compare")
+    args = parser.parse_args()
+
+    results = {"python": sys.version.split()[0], "numpy": np.__version__, "platform": platform.platform(),
+               "revision": git_revision(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "records_per_chunk": basewrapper.records_per_chunk, "cases": []}
+
+    # The engines import scipy on first use; that cost is measured by import_time.py instead
+    run_case(*make_case(100, 1, args.generator, args.seed), False)
+
+    for n in args.points:
+        for k in args.variables:
+            if n * k > args.max_cells:
+                print(f"{n:>9} x {k:<4} skipped, above --max-cells")
+                continue
+            data_model, settings = make_case(n, k, args.generator, args.seed)
+            runs = [run_case(data_model, settings, False) for _ in range(args.repeat)]
+            case = {"points": n, "variables": k, "generator": args.generator, **summarize(runs)}
+            if not args.no_memory:
+                case["peak_bytes"] = run_case(data_model, settings, True)["peak_bytes"]
+            results["cases"].append(case)
+
+            stages = ", ".join(f"{stage} {seconds:.3f}" for stage, seconds in case["stages_seconds"].items()
+                               if seconds >= 0.0005)
+            peak = f", peak {case['peak_bytes'] / 2 ** 20:.1f} MB" if "peak_bytes" in case else ""
+            print(f"{n:>9} x {k:<4} {case['total_seconds']:8.3f} s ({stages}){peak}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare and compare(results, args.compare, args.tolerance, args.floor):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
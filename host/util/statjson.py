@@ -0,0 +1,112 @@
+# Stand-ins for the output objects of the host; get_json serializes them like the product does
+
+
+class StatJSON:
+    def __init__(self, name):
+        self.name = name
+        self.items = []
+
+    def add_chart(self, chart):
+        self.items.append(chart)
+
+    def add_table(self, table):
+        self.items.append(table)
+
+    def add_notes(self, notes):
+        self.items.append(notes)
+
+    def add_warnings(self, warnings):
+        self.items.append(warnings)
+
+    def get_json(self):
+        return {"name": self.name, "items": [item.to_dict() for item in self.items]}
+
+
+class GplChart:
+    def __init__(self, title):
+        self.title = title
+        self.statements = []
+        self.mappings = []
+
+    def add_gpl_statement(self, statements):
+        self.statements.extend(statements)
+
+    def add_variable_mapping(self, name, values, dataset):
+        self.mappings.append((dataset, name, values))
+
+    def to_dict(self):
+        return {"type": "chart", "title": self.title, "gpl": self.statements,
+                "data": [{"dataset": dataset, "name": name,
+                          "values": [value if isinstance(value, str) else float(value) for value in values]}
+                         for dataset, name, values in self.mappings]}
+
+
+class Cell:
+    def __init__(self, value, decimals=None):
+        self.value = value
+        self.decimals = decimals
+
+
+class Table:
+    """Pivot table with nested row and column dimensions; add_cells fills it row by row"""
+
+    def __init__(self, title, template_name=None):
+        self.title = title
+        self.template_name = template_name
+        self.decimals = None
+        self.row_dimensions = []
+        self.column_dimensions = []
+        self.cells = []
+        self.footnotes = []
+
+    def set_default_cell_format(self, decimals=None):
+        self.decimals = decimals
+
+    def add_row_dimension(self, name, labels):
+        self.row_dimensions.append((name, list(labels)))
+
+    def add_column_dimensions(self, name, labels):
+        self.column_dimensions.append((name, list(labels)))
+
+    def add_cells(self, cells):
+        self.cells.extend(cell if isinstance(cell, Cell) else Cell(cell) for cell in cells)
+
+    def add_footnotes(self, text):
+        self.footnotes.append(text)
+
+    def cell_to_dict(self, cell):
+        if cell.value is None or isinstance(cell.value, str):
+            return {"value": cell.value}
+        decimals = self.decimals if cell.decimals is None else cell.decimals
+        output = {"value": float(cell.value)}
+        if decimals is not None:
+            output["decimals"] = decimals
+        return output
+
+    def to_dict(self):
+        columns = 1
+        for _, labels in self.column_dimensions:
+            columns *= len(labels)
+        return {"type": "table", "title": self.title, "template": self.template_name,
+                "rowDimensions": [{"name": name, "labels": labels} for name, labels in self.row_dimensions],
+                "columnDimensions": [{"name": name, "labels": labels} for name, labels in self.column_dimensions],
+                "cells": [[self.cell_to_dict(cell) for cell in self.cells[i:i + columns]]
+                          for i in range(0, len(self.cells), columns)],
+                "footnotes": self.footnotes}
+
+
+class Notes:
+    def __init__(self, title, text):
+        self.title = title
+        self.text = text
+
+    def to_dict(self):
+        return {"type": "notes", "title": self.title, "text": self.text}
+
+
+class Warnings:
+    def __init__(self, text):
+        self.text = text
+
+    def to_dict(self):
+        return {"type": "warnings", "text": self.text}
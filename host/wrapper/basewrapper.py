@@ -0,0 +1,111 @@
+# Minimal stand-in for the SPSS Statistics extension host, so tsf_wrapper can be imported and
+# executed outside of the product by the benchmarks and the batch runner. Only the calls the
+# extension makes exist.
+
+import os
+import json
+
+_properties = {}
+_defaults = {}
+_settings = {}
+_name = None
+_directory = None
+records_per_chunk = 0
+outputs = []
+
+
+def init_wrapper(name, properties_file):
+    global _name, _directory, records_per_chunk
+    _name = name
+    _directory = os.path.dirname(os.path.abspath(properties_file))
+    with open(properties_file, encoding="utf-8") as f:
+        _properties.update(json.load(f))
+    _defaults.clear()
+    _defaults.update({prop["id"]: prop["default"] for prop in _properties.get("properties", [])
+                      if "default" in prop})
+    records_per_chunk = int(_properties.get("backend_processing", {}).get("records_per_chunk", 0))
+
+
+def get_name():
+    return _name
+
+
+class LangResource:
+    def __init__(self, path):
+        with open(path, encoding="utf-8") as f:
+            self.strings = json.load(f)
+
+    def loadstring(self, key):
+        return self.strings.get(key, key)
+
+
+def get_lang_resource(lang):
+    path = os.path.join(_directory, "intl", f"{_name}_{lang}.json")
+    if not os.path.exists(path):
+        path = os.path.join(_directory, "intl", f"{_name}_en.json")
+    return LangResource(path)
+
+
+def check_settings(settings, fields):
+    _settings.clear()
+    _settings.update(_defaults)
+    _settings.update({key: value for key, value in settings.items() if value is not None})
+
+
+def get_value(key):
+    return _settings.get(key)
+
+
+def is_set(key):
+    return _settings.get(key) not in (None, "", [])
+
+
+class ColumnChunk:
+    """Rows start:stop of a data model that holds one array per field instead of records"""
+
+    def __init__(self, columns, start, stop):
+        self.columns = columns
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def column(self, index):
+        return self.columns[index][self.start:self.stop]
+
+    def __iter__(self):
+        for i in range(self.start, self.stop):
+            yield [column[i] for column in self.columns]
+
+
+def get_records(iterator_id, data_model, callback):
+    # Delivers the records in chunks of records_per_chunk followed by None, as the host does.
+    # A data model with "columns" instead of "records" is delivered as ColumnChunk slices.
+    columns = data_model.get("columns")
+    if columns is not None:
+        rows = len(columns[0]) if columns else 0
+
+        def chunk(start, stop):
+            return ColumnChunk(columns, start, stop)
+    else:
+        records = data_model["records"]
+        rows = len(records)
+
+        def chunk(start, stop):
+            return records[start:stop]
+
+    if records_per_chunk <= 0:
+        callback(chunk(0, rows))
+        return
+    for start in range(0, rows, records_per_chunk):
+        callback(chunk(start, min(start + records_per_chunk, rows)))
+    callback(None)
+
+
+def generate_output(output_json, output_data):
+    outputs.append((output_json, output_data))
+
+
+def finish():
+    pass
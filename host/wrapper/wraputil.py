@@ -0,0 +1,5 @@
+def get_index(fields, name):
+    for i, field in enumerate(fields):
+        if field["name"] == name:
+            return i
+    return None
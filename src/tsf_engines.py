@@ -0,0 +1,480 @@
+# ***********************************************************************
+# * Licensed Materials - Property of IBM
+# *
+# * IBM SPSS Products: Statistics Common
+# *
+# * (C) Copyright IBM Corp. 1989, 2025
+# *
+# * US Government Users Restricted Rights - Use, duplication or disclosure
+# * restricted by GSA ADP Schedule Contract with IBM Corp.
+# ************************************************************************
+
+# Filter engines of the time series filters extension. They only depend on NumPy and SciPy, not
+# on the extension host, so worker processes started with spawn can import them on their own.
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from collections import OrderedDict
+from functools import lru_cache
+import threading
+import warnings
+
+
+# Banded HP filter engine. The trend solves (I + lamb * D'D) trend = x, where D is the
+# second difference operator, so the system is symmetric pentadiagonal. The banded
+# Cholesky factor only depends on (n, lamb) and is reused for every series of that length.
+HP_FACTOR_CACHE_SIZE = 8
+_hp_factor_cache = OrderedDict()
+_hp_factor_lock = threading.Lock()
+
+
+@lru_cache(maxsize=4)
+def hp_penalty_band(n):
+    # Upper banded storage of D'D; shared by every lambda for series of length n
+    band = np.zeros((3, n))
+    band[0, 2:] = 1.0
+    band[1, 1:-1] -= 2.0
+    band[1, 2:] -= 2.0
+    band[2, :-2] += 1.0
+    band[2, 1:-1] += 4.0
+    band[2, 2:] += 1.0
+    band.flags.writeable = False
+    return band
+
+
+def hp_banded_matrix(n, lamb):
+    # Upper banded storage of I + lamb * D'D as expected by scipy.linalg.cholesky_banded
+    ab = lamb * hp_penalty_band(n)
+    ab[2] += 1.0
+    return ab
+
+
+def hp_factor(n, lamb):
+    from scipy.linalg import cholesky_banded
+
+    key = (n, float(lamb))
+    with _hp_factor_lock:
+        factor = _hp_factor_cache.get(key)
+        if factor is not None:
+            _hp_factor_cache.move_to_end(key)
+            return factor
+
+    factor = cholesky_banded(hp_banded_matrix(n, lamb), lower=False)
+    with _hp_factor_lock:
+        _hp_factor_cache[key] = factor
+        while len(_hp_factor_cache) > HP_FACTOR_CACHE_SIZE:
+            _hp_factor_cache.popitem(last=False)
+    return factor
+
+
+def hp_filter_engine(x, lamb=1600):
+    # x is a single series (n,) or a stack of series (n, k) sharing one factorization
+    from scipy.linalg import cho_solve_banded
+
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[0]
+    if n < 3:
+        raise ValueError(f"HP filter needs at least 3 observations, got {n}")
+
+    trend = cho_solve_banded((hp_factor(n, lamb), False), x, check_finite=False)
+    cycle = x - trend
+    return cycle, trend
+
+
+def hp_sweep_engine(x, lambdas, one_sided=False):
+    # Yields (lamb, cycle, trend) for each lambda; the difference operator is built once and
+    # every lambda is one banded factorization solved for all columns at once. Factors are not
+    # kept in the shared cache so a long sweep does not evict the regular entries.
+    from scipy.linalg import cholesky_banded, cho_solve_banded
+
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[0]
+    if n < 3:
+        raise ValueError(f"HP filter needs at least 3 observations, got {n}")
+
+    for lamb in lambdas:
+        if one_sided:
+            yield (lamb,) + hp_onesided_engine(x, lamb)
+            continue
+        factor = cholesky_banded(hp_banded_matrix(n, lamb), lower=False)
+        trend = cho_solve_banded((factor, False), x, check_finite=False)
+        yield lamb, x - trend, trend
+
+
+# One-sided (real-time) HP filter. The HP trend is the smoothed state of the local linear
+# trend model y_t = tau_t + c_t, (1 - L)^2 tau_t = eta_t with var(c) / var(eta) = lamb, so
+# the filtered state tau_t|t is the last point of the HP trend fitted to y_1..y_t. The first
+# two observations initialize the state exactly; from there the Kalman gains do not depend
+# on the data, converge quickly and the remaining pass is a fixed second order IIR filter.
+HP_ONESIDED_TOLERANCE = 1e-14
+
+
+@lru_cache(maxsize=16)
+def hp_onesided_gains(lamb, max_steps):
+    # Kalman gains for t = 3, 4, ... until they settle, plus the steady state gain. The gains can
+    # stand still for a step while the covariance is still moving (lamb = 1 at t = 6), so the
+    # recursion stops once the predicted covariance itself no longer changes.
+    q = 1.0 / lamb
+    p00, p01, p11 = 1.0, 0.0, 1.0
+    gains = []
+    k1 = k2 = 0.0
+    predicted = None
+    for _ in range(max_steps):
+        m00 = 4.0 * p00 - 4.0 * p01 + p11 + q
+        m01 = 2.0 * p00 - p01
+        m11 = p00
+        if predicted is not None and all(abs(new - old) <= HP_ONESIDED_TOLERANCE * (1.0 + abs(new))
+                                         for new, old in zip((m00, m01, m11), predicted)):
+            break
+        predicted = (m00, m01, m11)
+        k1 = m00 / (m00 + 1.0)
+        k2 = m01 / (m00 + 1.0)
+        gains.append((k1, k2))
+        p00, p01, p11 = m00 - k1 * m00, m01 - k1 * m01, m11 - k2 * m01
+    return np.array(gains).reshape(-1, 2), (k1, k2)
+
+
+def hp_onesided_engine(x, lamb=1600):
+    # Causal trend for every observation in one pass; x is (n,) or (n, k)
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[0]
+    if n < 3:
+        raise ValueError(f"HP filter needs at least 3 observations, got {n}")
+
+    trend = np.r_[x[:2], hp_onesided_pass(x[2:], lamb, 2, x[1], x[0])]
+    return x - trend, trend
+
+
+def hp_onesided_pass(x, lamb, start, level, previous):
+    # Filtered trend for the rows x observed at times start, start + 1, ... given the state
+    # (tau_start-1, tau_start-2) left by the earlier rows
+    from scipy.signal import lfilter
+
+    gains, (k1, k2) = hp_onesided_gains(float(lamb), start + len(x) - 2)
+    gains = gains[start - 2:]
+    trend = np.empty_like(x)
+    level = np.array(level, dtype=np.float64)
+    previous = np.array(previous, dtype=np.float64)
+
+    # Transient: state (tau_t, tau_t-1) for every column, gains still moving
+    t = 0
+    for g1, g2 in gains[:len(x)]:
+        predicted = 2.0 * level - previous
+        innovation = x[t] - predicted
+        level, previous = predicted + g1 * innovation, level + g2 * innovation
+        trend[t] = level
+        t += 1
+
+    # Steady state: tau_t = (2 - 2 k1 + k2) tau_t-1 - (1 - k1) tau_t-2 + k1 y_t - k2 y_t-1
+    if t < len(x):
+        a = [1.0, -(2.0 * (1.0 - k1) + k2), 1.0 - k1]
+        zi = np.array([(1.0 - k1) * (2.0 * level - previous), -(1.0 - k1) * level])
+        trend[t:] = lfilter([k1, -k2], a, x[t:], axis=0, zi=zi)[0]
+    return trend
+
+
+# Appending rows to an HP series moves the old trend by an amount that decays geometrically
+# with the distance from the end, at the rate of the smallest root of lamb (1 - z)^4 + z^2.
+# The saved trend is kept up to the point where that change is below HP_TAIL_TOLERANCE and
+# only the rows after it are solved again, with the kept values moved to the right hand side.
+HP_TAIL_TOLERANCE = 1e-12
+
+
+@lru_cache(maxsize=16)
+def hp_tail_window(lamb):
+    roots = np.roots(lamb * np.array([1.0, -4.0, 6.0, -4.0, 1.0]) + np.array([0.0, 0.0, 1.0, 0.0, 0.0]))
+    decay = np.abs(roots).min()
+    return int(np.ceil(np.log(HP_TAIL_TOLERANCE) / np.log(decay)))
+
+
+def hp_tail_update(x, rows, saved, lamb=1600):
+    # x is the full column, the first rows of which produced the saved (cycle, trend)
+    from scipy.linalg import cholesky_banded, cho_solve_banded
+
+    x = np.asarray(x, dtype=np.float64)
+    start = rows - hp_tail_window(lamb)
+    if start < 2:
+        return hp_filter_engine(x, lamb)
+
+    head = saved[1][:start]
+    length = len(x) - start
+    ab = lamb * hp_penalty_band(length + 2)[:, 2:]
+    ab[2] += 1.0
+    rhs = x[start:].copy()
+    rhs[0] -= lamb * (head[-2] - 4.0 * head[-1])
+    rhs[1] -= lamb * head[-1]
+    trend = np.r_[head, cho_solve_banded((cholesky_banded(ab, lower=False), False), rhs, check_finite=False)]
+    return x - trend, trend
+
+
+def hp_onesided_update(x, rows, saved, lamb=1600):
+    # The causal trend never changes for old rows; the Kalman pass resumes from the last state
+    x = np.asarray(x, dtype=np.float64)
+    if rows < 3:
+        return hp_onesided_engine(x, lamb)
+
+    # The state holds tau_t-1|t rather than the saved tau_t-1|t-1; undo the last update to get it
+    t = rows - 1
+    gains, steady = hp_onesided_gains(float(lamb), t - 1)
+    g1, g2 = gains[t - 2] if t - 2 < len(gains) else steady
+    level = saved[1][t]
+    predicted = (level - g1 * x[t]) / (1.0 - g1)
+    previous = saved[1][t - 1] + g2 * (x[t] - predicted)
+    trend = np.r_[saved[1][:rows], hp_onesided_pass(x[rows:], lamb, rows, level, previous)]
+    return x - trend, trend
+
+
+def bk_tail_update(x, rows, saved, low=6, high=32, K=12):
+    # Only the centered values whose window reaches the new rows are computed
+    x = np.asarray(x, dtype=np.float64)
+    K = int(K)
+    if rows < 2 * K + 1:
+        return bk_filter_engine(x, low, high, K)
+    if rows == len(x):
+        return saved[0]
+    return np.r_[saved[0], bk_filter_engine(x[rows - 2 * K:], low, high, K)]
+
+
+def cf_full_update(x, rows, saved, low=6, high=32, drift=True):
+    # Every CF value depends on the sample end and the drift, so the whole series is refiltered
+    return cf_filter_engine(x, low, high, drift)
+
+
+# Condition number of the scaled normal equations above which a column counts as rank deficient
+HAMILTON_CONDITION_LIMIT = 1e12
+
+# Hamilton (2018) regression filter: y(t+h) is regressed on a constant and y(t), ..., y(t-p+1)
+# and the residual is the cycle. The lags are read through strided windows of the series, and
+# each column gets its own least squares fit from batched normal equations. The regressors are
+# y(t) and the p-1 differences y(t) - y(t-1), ..., which span the same space as the p levels
+# but keep the normal equations well conditioned for trending series.
+def hamilton_filter_engine(x, h=8, p=4):
+    # Returns the cycle and trend for rows h+p-1, ..., n-1 of a series (n,) or a stack of series (n, k)
+    x = np.asarray(x, dtype=np.float64)
+    squeeze = x.ndim == 1
+    if squeeze:
+        x = x[:, None]
+    h, p = int(h), int(p)
+    if h < 1 or p < 1:
+        raise ValueError(f"Hamilton filter needs h >= 1 and p >= 1, got h={h} and p={p}")
+    n = x.shape[0]
+    m = n - h - p + 1
+    if m <= p + 1:
+        raise ValueError(f"Hamilton filter needs more than h + 2p ({h + 2 * p}) observations, got {n}")
+
+    centered = x - x[:n - h].mean(axis=0)
+    level = centered[p - 1:n - h]
+    target = centered[h + p - 1:]
+
+    # Sums of products of the regressors, (k, p, p), and with the target, (k, p)
+    gram = np.empty((x.shape[1], p, p))
+    cross = np.empty((x.shape[1], p))
+    means = np.empty((x.shape[1], p))
+    gram[:, 0, 0] = np.einsum("mk,mk->k", level, level)
+    cross[:, 0] = np.einsum("mk,mk->k", level, target)
+    means[:, 0] = level.mean(axis=0)
+    if p > 1:
+        # (m, k, p-1) view of y(t) - y(t-1), ..., y(t-p+2) - y(t-p+1), newest first
+        diffs = sliding_window_view(np.diff(x[:n - h], axis=0), p - 1, axis=0)[:, :, ::-1]
+        gram[:, 0, 1:] = gram[:, 1:, 0] = np.einsum("mk,mki->ki", level, diffs)
+        gram[:, 1:, 1:] = np.einsum("mki,mkj->kij", diffs, diffs)
+        cross[:, 1:] = np.einsum("mki,mk->ki", diffs, target)
+        means[:, 1:] = diffs.mean(axis=0)
+
+    # The constant is absorbed by centering the normal equations on the regressor means
+    target_mean = target.mean(axis=0)
+    gram = gram / m - means[:, :, None] * means[:, None, :]
+    cross = cross / m - means * target_mean[:, None]
+    scale = np.sqrt(np.einsum("kii->ki", gram))
+    scale[scale == 0] = 1.0
+    normal = gram / (scale[:, :, None] * scale[:, None, :])
+    rhs = (cross / scale)[..., None]
+    # Collinear regressors, e.g. a linear trend or a constant series, leave the normal equations of
+    # that column singular; those columns take the minimum norm least squares solution instead
+    singular = np.linalg.cond(normal) > HAMILTON_CONDITION_LIMIT
+    beta = np.empty_like(cross)
+    if not singular.all():
+        beta[~singular] = np.linalg.solve(normal[~singular], rhs[~singular])[..., 0]
+    if singular.any():
+        beta[singular] = (np.linalg.pinv(normal[singular], rcond=1.0 / HAMILTON_CONDITION_LIMIT, hermitian=True)
+                          @ rhs[singular])[..., 0]
+    beta /= scale
+
+    trend = level * beta[:, 0]
+    if p > 1:
+        trend += np.einsum("mki,ki->mk", diffs, beta[:, 1:])
+    trend += target_mean - np.einsum("ki,ki->k", means, beta)
+    cycle = target - trend
+    trend += x[:n - h].mean(axis=0)
+    if squeeze:
+        return cycle[:, 0], trend[:, 0]
+    return cycle, trend
+
+
+def hamilton_full_update(x, rows, saved, h=8, p=4):
+    # The regression coefficients move with every appended row, so the whole series is refitted
+    return hamilton_filter_engine(x, h, p)
+
+
+# Vectorized Christiano-Fitzgerald random walk filter. The ideal band pass coefficients
+# B_j only depend on (low, high), so they are cached and extended when a longer series
+# arrives. The two truncated weighted sums of the asymmetric filter are convolutions
+# of B_j with the series, evaluated for every observation at once with an FFT.
+_cf_weight_cache = {}
+
+
+def cf_weights(n, low, high):
+    key = (float(low), float(high))
+    bj = _cf_weight_cache.get(key)
+    if bj is None or len(bj) < n + 1:
+        a = 2 * np.pi / high
+        b = 2 * np.pi / low
+        j = np.arange(1, n + 1)
+        bj = np.r_[(b - a) / np.pi, (np.sin(b * j) - np.sin(a * j)) / (np.pi * j)]
+        _cf_weight_cache[key] = bj
+    return bj[:n + 1]
+
+
+def cf_filter_engine(x, low=6, high=32, drift=True):
+    from scipy.signal import fftconvolve
+
+    if low < 2:
+        raise ValueError("low must be >= 2")
+
+    x = np.asarray(x, dtype=np.float64)
+    squeeze = x.ndim == 1
+    if squeeze:
+        x = x[:, None]
+    n = x.shape[0]
+    if n < 3:
+        raise ValueError(f"CF filter needs at least 3 observations, got {n}")
+
+    if drift:
+        x = x - np.arange(n)[:, None] * (x[-1] - x[0]) / (n - 1)
+
+    bj = cf_weights(n, low, high)
+    b0 = bj[0]
+    kernel = np.r_[0.0, bj[1:n]][:, None]
+
+    # Backward sum over x[1..i-1] and forward sum over x[i+1..n-2], both as one convolution
+    k = x.shape[1]
+    sums_input = np.empty((n, 2 * k))
+    sums_input[:, :k] = x
+    sums_input[0, :k] = 0.0
+    sums_input[:, k:] = x[::-1]
+    sums_input[0, k:] = 0.0
+    sums = fftconvolve(sums_input, kernel, axes=0)[:n]
+    backward = sums[:, :k]
+    forward = sums[::-1, k:]
+
+    cumulative = np.r_[0.0, np.cumsum(bj[1:n])]
+    i = np.arange(n)
+    tail = cumulative[np.maximum(n - i - 2, 0)][:, None]
+    head = cumulative[np.maximum(i - 1, 0)][:, None]
+    end_weight = -0.5 * b0 - tail
+    start_weight = -b0 - tail - head - end_weight
+
+    cycle = b0 * x + forward + backward + end_weight * x[-1] + start_weight * x[0]
+    trend = x - cycle
+    if squeeze:
+        return cycle[:, 0], trend[:, 0]
+    return cycle, trend
+
+
+# Baxter-King band pass filter. The symmetric 2K+1 weights are cached per (low, high, K).
+# Short filters are applied as a direct sliding window product, longer ones through an
+# FFT convolution, whose cost no longer grows with K.
+BK_DIRECT_MAX_TAPS = 49
+_bk_weight_cache = {}
+
+
+def bk_weights(low, high, K):
+    key = (float(low), float(high), int(K))
+    weights = _bk_weight_cache.get(key)
+    if weights is None:
+        omega_1 = 2.0 * np.pi / high
+        omega_2 = 2.0 * np.pi / low
+        j = np.arange(1, K + 1)
+        side = (np.sin(omega_2 * j) - np.sin(omega_1 * j)) / (np.pi * j)
+        weights = np.r_[side[::-1], (omega_2 - omega_1) / np.pi, side]
+        # Make sure the weights sum to zero
+        weights -= weights.mean()
+        _bk_weight_cache[key] = weights
+    return weights
+
+
+def bk_filter_engine(x, low=6, high=32, K=12):
+    # Returns the n - 2K centered cycle values for a series (n,) or a stack of series (n, k)
+    x = np.asarray(x, dtype=np.float64)
+    K = int(K)
+    n = x.shape[0]
+    taps = 2 * K + 1
+    if n < taps:
+        raise ValueError(f"BK filter needs more than 2K ({2 * K}) observations, got {n}")
+
+    weights = bk_weights(low, high, K)
+    if taps <= BK_DIRECT_MAX_TAPS:
+        return sliding_window_view(x, taps, axis=0) @ weights
+
+    from scipy.signal import fftconvolve
+
+    if x.ndim == 2:
+        weights = weights[:, None]
+    return fftconvolve(x, weights, mode="valid", axes=0)
+
+
+def filter_panel_group(task):
+    # Runs in a worker process, which only imports this module; the RuntimeWarning filter that
+    # tsf_wrapper sets for the host process is applied here as well
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", category=RuntimeWarning)
+        return filter_group(*task)
+
+
+def stacked_by_length(columns, names):
+    # Yields (names, (n, k) stack) for the variables of each length. Variables trimmed to different
+    # spans cannot share a stack, but every engine filters the columns of a stack independently.
+    lengths = {}
+    for var in names:
+        lengths.setdefault(len(columns[var]), []).append(var)
+    for group_names in lengths.values():
+        yield group_names, np.column_stack([columns[var] for var in group_names])
+
+
+def filter_group(columns, filter_settings):
+    group_result = {}
+
+    if "hp_filter" in filter_settings:
+        names, lamb, engine = filter_settings["hp_filter"]
+        group_result["hp_filter"] = {}
+        for group_names, data in stacked_by_length(columns, names):
+            cycle, trend = engine(data, lamb)
+            group_result["hp_filter"].update((var, {"cycle": cycle[:, i], "trend": trend[:, i]})
+                                             for i, var in enumerate(group_names))
+
+    if "hamilton_filter" in filter_settings:
+        names, h, p = filter_settings["hamilton_filter"]
+        group_result["hamilton_filter"] = {}
+        for group_names, data in stacked_by_length(columns, names):
+            cycle, trend = hamilton_filter_engine(data, h, p)
+            group_result["hamilton_filter"].update((var, {"cycle": cycle[:, i], "trend": trend[:, i]})
+                                                   for i, var in enumerate(group_names))
+
+    if "bk_filter" in filter_settings:
+        names, low, high, k = filter_settings["bk_filter"]
+        group_result["bk_filter"] = {}
+        for group_names, data in stacked_by_length(columns, names):
+            cycle = bk_filter_engine(data, low, high, k)
+            group_result["bk_filter"].update((var, cycle[:, i]) for i, var in enumerate(group_names))
+
+    if "cf_filter" in filter_settings:
+        names, low, high, drift = filter_settings["cf_filter"]
+        group_result["cf_filter"] = {}
+        for group_names, data in stacked_by_length(columns, names):
+            cycle, trend = cf_filter_engine(data, low, high, drift=drift)
+            group_result["cf_filter"].update((var, {"cycle": cycle[:, i], "trend": trend[:, i]})
+                                             for i, var in enumerate(group_names))
+
+    # Results keep the order of the selected variables
+    return {filter_name: {var: filter_result[var] for var in filter_settings[filter_name][0]}
+            for filter_name, filter_result in group_result.items()}
@@ -12,11 +12,23 @@
 from wrapper.basewrapper import *
 from wrapper import wraputil
 from util.statjson import *
+from tsf_engines import *
 
+# scipy and the process pool are imported inside the functions that need them, so loading
+# the extension and runs that stop before filtering do not pay for them
 import numpy as np
-import statsmodels.api as sm
-from datetime import datetime
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
 import re
+import json
+import time
+import hashlib
+import itertools
+import shutil
+import tempfile
+import threading
+import tracemalloc
 
 import warnings
 import traceback
@@ -27,20 +39,40 @@ log_error = logging.error
 
 warnings.simplefilter("error", category=RuntimeWarning)
 
+# Only StatJSON, GplChart, Notes and Warnings of util.statjson are known to exist in every host.
+# Pivot tables are used when it also has Table, Cell and StatJSON.add_table; otherwise the
+# profile, sweep, spectrum and plan tables are written as fixed width text in Notes.
+PIVOT_TABLES = "Table" in globals() and "Cell" in globals() and hasattr(StatJSON, "add_table")
+
+if "Cell" not in globals():
+    class Cell:
+        """Table value shown with a fixed number of decimals"""
+
+        def __init__(self, value, decimals=None):
+            self.value = value
+            self.decimals = decimals
+
 """Initialize the tsf wrapper"""
-init_wrapper("tsf", os.path.join(os.path.dirname(__file__), "TSF-properties.json"))
+properties_file = os.path.join(os.path.dirname(__file__), "TSF-properties.json")
+init_wrapper("tsf", properties_file)
 
 hp_filter = True
 bk_filter = False
 cf_filter = False
+hamilton_filter = False
 
 
-def execute(iterator_id, data_model, settings, lang="en"):
+def execute(iterator_id, data_model, settings, lang="en", save_output=None, save_parts=("trend", "cycle")):
+    # SAVE is not delivered: the host's contract for adding variables to the active dataset is not
+    # confirmed, so the command syntax cannot write results back. Headless callers such as the batch
+    # runner pass save_output, a callable that receives the save_parts of every filter result as
+    # new variables {"fields", "data"}.
     fields = data_model["fields"]
     output_json = StatJSON(get_name())
     xtIntl = get_lang_resource(lang)
 
     check_settings(settings, fields)
+    profiler.reset(bool(get_value("profile")), get_value("profile_log") or None)
 
     date_factor = get_value("factors")
     time_variable_index = wraputil.get_index(fields, "DATE_")
@@ -52,36 +84,88 @@ def execute(iterator_id, data_model, settings, lang="en"):
         warning_item = Warnings(xtIntl.loadstring("no_time_var_error"))
         output_json.add_warnings(warning_item)
         return
-    
+
+    # Only the fields named on HP /VAR and BK_CF /VARS plus the time and panel variables are decoded
+    label_indices = [time_variable_index]
+    if is_set("panel_variable"):
+        label_indices.append(wraputil.get_index(fields, get_value("panel_variable")))
+    projection = ColumnProjection(fields, get_referenced_variables(), label_indices)
+
+    # With a positive records_per_chunk the host delivers the data in chunks, only the
+    # referenced columns are kept and the filters run once the last chunk has arrived.
+    records_per_chunk = get_records_per_chunk()
+    stream = None
+    if records_per_chunk > 0:
+        stream = ColumnStream(projection, records_per_chunk)
+
+    # OPTIONS SPILLMB moves large matrices to scratch files, FLOAT32 halves the chart and saved values
+    float32_output = bool(get_value("float32_output"))
+    spill_bytes = float(get_value("spill_threshold") or 0) * 1024 * 1024
+    pool = BufferPool(spill_bytes, get_value("cache_directory") or None)
+
+    output_data = None
+
     def execute_model(data):
-            
-        if data is not None:
+        nonlocal output_data
+
+        if stream is not None:
+            if stream.finished:
+                return
+            try:
+                if data is not None and len(data) > 0:
+                    with profiler.stage("Ingest", len(data)):
+                        stream.append(data)
+                    if len(data) >= records_per_chunk:
+                        return
+            except Exception as err:
+                # A chunk that cannot be decoded ends the stream, the error is reported below
+                stream.error = err
+            stream.finished = True
+            if stream.rows == 0 and stream.error is None:
+                return
+        elif data is not None:
             case_count = len(data)
         else:
             return
         try:
-            global hp_filter, bk_filter, cf_filter
-
-            records = RecordData(data)
-            columns_data = records.get_columns()
-            no_of_rows = len(data)
+            global hp_filter, bk_filter, cf_filter, hamilton_filter
+
+            if stream is not None and stream.error is not None:
+                raise stream.error
+
+            with profiler.stage("Projection", stream.rows if stream is not None else len(data)):
+                columns_data = stream.get_columns() if stream is not None else projection.decode(data)
+            if stream is not None:
+                output_json.add_notes(Notes(xtIntl.loadstring("ingestion_title"),
+                                            xtIntl.loadstring("ingestion_summary").format(
+                                                stream.rows, stream.chunks, format_bytes(stream.peak_bytes))))
+            output_json.add_notes(Notes(xtIntl.loadstring("projection_title"),
+                                        xtIntl.loadstring("projection_summary").format(
+                                            projection.decoded_columns, projection.field_count,
+                                            projection.skipped_columns, projection.skipped_cells)))
 
             time_data = []
 
             if date_factor is not None and len(date_factor) > 0:
-                time_data = parse_and_sort_factors(date_factor)
+                with profiler.stage("Date parsing", len(date_factor)):
+                    time_data = parse_and_sort_factors(date_factor)
             else:
                 time_data = columns_data[time_variable_index]
 
             hp_filter = get_value("hpfilter")
             bk_filter = get_value("bkfilter")
             cf_filter = get_value("cffilter")
+            hamilton_filter = get_value("hamiltonfilter")
 
-            hp_variable = get_value("hpvariable")
+            hp_names = get_hp_variables()
 
-            lamda = get_value("lamb")
-            if lamda is None or lamda == "":
-                lamda = 1600
+            # HP /LAMBDA takes one value or a list of values to sweep, /LAMBDARANGE a log-spaced range
+            lambdas = get_lambdas()
+            lamda = lambdas[0]
+            # HP /ONESIDED swaps the two-sided solve for the real-time Kalman pass
+            one_sided = bool(get_value("hp_one_sided"))
+            hp_name, hp_engine = ("hprt", hp_onesided_engine) if one_sided else ("hp", hp_filter_engine)
+            hp_footnote = xtIntl.loadstring("hp_onesided_footnote") if one_sided else None
 
             bk_cf_names = []
             bk_cf_fnotes = []
@@ -89,109 +173,286 @@ def execute(iterator_id, data_model, settings, lang="en"):
             if is_set("bk_cf_variables"):
                  bk_cf_names.extend(get_value("bk_cf_variables"))
                  bk_cf_fnotes.extend(get_value("bk_cf_variables"))
-                
+
+            # save_parts go to save_output when one is given, NOPLOTS skips all chart building
+            # and SMALLMULTIPLES draws the BK/CF variables as panels of one chart instead of a chart each
+            no_plots = bool(get_value("no_plots"))
+            chart_max_points = get_value("chart_max_points")
+            chart_max_points = 2000 if chart_max_points is None else int(chart_max_points)
+            charts = ChartBuilder(xtIntl, output_json, chart_max_points, float32_output,
+                                  bool(get_value("small_multiples")))
+            saving = save_output is not None
+            save_data = SaveData(projection.rows, saving and "trend" in save_parts, saving and "cycle" in save_parts,
+                                 pool, np.float32 if float32_output else np.float64)
+
+            # OPTIONS DRYRUN reports the planned stages without filtering, charting or saving
+            dry_run = bool(get_value("dry_run"))
+
+            if is_set("panel_variable"):
+                if hp_filter and len(lambdas) > 1:
+                    raise ValueError("A LAMBDA list or LAMBDARANGE cannot be used with PANEL, give one LAMBDA value.")
+                with profiler.stage("Panel", projection.rows):
+                    execute_panel_model(xtIntl, columns_data, time_data, fields, hp_names, lamda, bk_cf_names,
+                                        output_json, charts, save_data, no_plots, one_sided, dry_run)
+                if dry_run:
+                    return
+                charts.finish()
+                with profiler.stage("Save", projection.rows):
+                    output_data = save_data.get_output()
+                return
+
+            cache = None
+            cache_directory = get_value("cache_directory") or os.path.join(tempfile.gettempdir(), "tsf_cache")
+            if get_value("use_cache"):
+                cache = ResultCache(cache_directory, float(get_value("cache_size") or 256) * 1024 * 1024)
+
+            # OPTIONS INCREMENTAL keeps per series state so appended rows only refilter the tail
+            state = None
+            if get_value("incremental"):
+                state = IncrementalState(os.path.join(cache_directory, "incremental"))
+
+            def run_filter(filter_name, engine, update, data, names, params):
+                if state is not None:
+                    return run_incremental(state, filter_name, engine, update, data, names, params)
+                return run_cached(cache, filter_name, engine, data, params)
+
             result = {}
 
-            if hp_filter:
-                # Adding here logic for hp_filter
-                result["hp_filter"] = {}
+            # MISSING: each variable keeps its own rows, leading/trailing gaps are trimmed and
+            # interior gaps interpolated or rejected; MASK writes interpolated points as missing.
+            # Rows now arrive pairwise, so interior gaps are interpolated linearly unless METHOD=REJECT
+            missing_method, missing_trim, missing_mask = get_missing_settings()
+            spans = {}
+            rejected = {}
+            for var in dict.fromkeys(hp_names + bk_cf_names):
+                var_index = wraputil.get_index(fields, var)
+                if var_index is None:
+                    continue
+                try:
+                    spans[var] = handle_missing(columns_data[var_index], missing_method, missing_trim)
+                except ValueError as err:
+                    rejected[var] = str(err)
+
+            gap_rows = []
+            for var, (start, values, mask) in spans.items():
+                trimmed = len(columns_data[wraputil.get_index(fields, var)]) - len(values)
+                filled = 0 if mask is None else int(mask.sum())
+                if trimmed or filled:
+                    gap_rows.append(xtIntl.loadstring("missing_summary").format(var, trimmed, filled))
+            if gap_rows:
+                output_json.add_notes(Notes(xtIntl.loadstring("missing_title"), "\n".join(gap_rows)))
+
+            def masked(var, values, offset=0):
+                mask = spans[var][2]
+                if missing_mask and mask is not None:
+                    return np.where(mask[offset:offset + len(values)], np.nan, values)
+                return values
+
+            # The plan checks every filter's settings and variables up front, stacks the variables
+            # of each span group once into a shared float64 matrix and runs the engines of the
+            # independent filters on a thread pool. Results are then saved and charted in order.
+            plan = ExecutionPlan(spans)
 
-                hp_index = wraputil.get_index(fields, hp_variable)
-                if hp_index is not None:
-                    hp_data = columns_data[hp_index]
-                    ts_data = np.array(hp_data)
-
-                    if np.any(np.isnan(ts_data)) or np.any(np.isinf(ts_data)):
-                        raise ValueError(f"{hp_variable} contains NaN or inf values, cannot apply HP filter.")
-                    
-                    cycle, trend = sm.tsa.filters.hpfilter(ts_data, lamda)
-                    result["hp_filter"] = {
-                        "cycle": cycle.tolist(),
-                        "trend": trend.tolist()
-                    }
-                    create_hp_filter_output(xtIntl, result, time_data, hp_data, hp_variable, fields, output_json)
-
-            if bk_filter or cf_filter:
-                if is_set("bk_cf_variables"):
-                    for var in bk_cf_names:
-                        var_index = wraputil.get_index(fields, var)
-                        if var_index is not None:
-                            var_data = columns_data[var_index]
-                            create_bk_cf_variable_time_series_plot(xtIntl, var_data, time_data, var, fields, output_json)
+            if hp_filter:
+                bad_vars = [f"{var} {rejected[var]}" for var in hp_names if var in rejected]
+                if bad_vars:
+                    raise ValueError(f"{', '.join(bad_vars)}, cannot apply HP filter.")
+                hp_vars = [var for var in hp_names if var in spans]
+                if len(lambdas) > 1:
+                    # The sweep writes its table and saved variables lambda by lambda on the main thread
+                    plan.add("HP sweep", hp_vars)
+                else:
+                    hp_update = hp_onesided_update if one_sided else hp_tail_update
+                    plan.add("HP filter", hp_vars,
+                             lambda data, names: run_filter(hp_name, hp_engine, hp_update, data, names, (lamda,)))
+
+            # HAMILTON regresses each HP variable on its own lags, on the same shared matrix as HP
+            if hamilton_filter:
+                bad_vars = [f"{var} {rejected[var]}" for var in hp_names if var in rejected]
+                if bad_vars:
+                    raise ValueError(f"{', '.join(bad_vars)}, cannot apply Hamilton filter.")
+                ham_h, ham_p = get_hamilton_settings()
+                plan.add("Hamilton filter", [var for var in hp_names if var in spans],
+                         lambda data, names: run_filter("hamilton", hamilton_filter_engine, hamilton_full_update,
+                                                        data, names, (ham_h, ham_p)))
+
+            if bk_filter and is_set("bk_cf_variables"):
+                low, high, k, _ = get_band_settings()
+
+                if low >= high:
+                    raise ValueError(f"low ({low}) must be less than high ({high})")
+
+                if k <= 0:
+                    raise ValueError(f"K ({k}) must be a positive integer")
+
+                bk_vars = []
+                for var in bk_cf_names:
+                    if var in rejected:
+                        log_error(f"Variable '{var}': {rejected[var]}")
+                    elif var in spans:
+                        if len(spans[var][1]) < 3:
+                            log_error(f"Variable '{var}': Needs ≥3 data points")
+                            continue
+                        bk_vars.append(var)
+
+                def run_bk(data, names, params=(low, high, k)):
+                    try:
+                        # One 2-D pass over all variables with weights shared across them
+                        return run_filter("bk", bk_filter_engine, bk_tail_update, data, names, params)
+                    except Exception as e:
+                        error_msg = f"Error processing variables {', '.join(names)}: {str(e)}"
+                        log_error(error_msg)
+                        raise type(e)(error_msg) from e
+
+                plan.add("BK filter", bk_vars, run_bk)
+
+            if cf_filter and is_set("bk_cf_variables"):
+                low, high, _, drift = get_band_settings()
+
+                if low >= high:
+                    raise ValueError(f"low ({low}) must be less than high ({high})")
+
+                bad_vars = [f"{var} {rejected[var]}" for var in bk_cf_names if var in rejected]
+                if bad_vars:
+                    raise ValueError(f"{', '.join(bad_vars)}, cannot apply CF filter.")
+                cf_vars = [var for var in bk_cf_names if var in spans]
+                for var in cf_vars:
+                    if len(spans[var][1]) < 3:
+                        raise ValueError(f"Insufficient data points for {var}.")
+
+                # The CF weights are built once and shared by every selected variable
+                plan.add("CF filter", cf_vars,
+                         lambda data, names: run_filter("cf", cf_filter_engine, cf_full_update, data, names,
+                                                        (low, high, bool(drift))))
+
+            # OPTIONS SPECTRUM compares the periodograms of the BK/CF variables and cycles with the filter gains
+            spectrum = bool(get_value("spectrum")) and (bk_filter or cf_filter) and is_set("bk_cf_variables")
+            filter_cycles = []
+
+            threads = int(get_value("filter_threads") or 0)
+            if threads <= 0:
+                threads = os.cpu_count() or 1
+
+            if dry_run:
+                stages = [("Spectrum", projection.rows)] if spectrum else []
+                if not no_plots:
+                    stages.append(("Charts", projection.rows))
+                if save_data.save_trend or save_data.save_cycle:
+                    stages.append(("Save", projection.rows))
+                add_table(output_json, plan.report(xtIntl, threads, stages))
+                return
+
+            with profiler.stage("Convert", projection.rows):
+                plan.stack(pool)
+            plan.run(threads)
 
+            if hp_filter:
+                result["hp_filter"] = {}
 
-            if bk_filter:
-                # Adding here logic for bk_filter
+                for (start, length), group_vars, hp_result in plan.results("HP sweep"):
+                    with profiler.stage("HP filter", length):
+                        execute_lambda_sweep(xtIntl, plan.data((start, length), group_vars), group_vars, lambdas,
+                                             output_json, save_data, one_sided, offset=start, masked=masked)
+
+                for (start, length), group_vars, (cycle, trend) in plan.results("HP filter"):
+                    group_time = span_time(time_data, start, length)
+                    for i, var in enumerate(group_vars):
+                        save_data.add(hp_name, var, cycle=masked(var, cycle[:, i]), trend=masked(var, trend[:, i]),
+                                      offset=start)
+                        if no_plots:
+                            continue
+                        result["hp_filter"][var] = {
+                            "cycle": cycle[:, i],
+                            "trend": trend[:, i]
+                        }
+                        create_hp_filter_output(charts, result, group_time, spans[var][1], var, hp_footnote)
+
+            if hamilton_filter:
+                result["hamilton_filter"] = {}
+                # The first h + p - 1 rows of each span have no lagged regressors
+                shift = ham_h + ham_p - 1
+
+                for (start, length), group_vars, (cycle, trend) in plan.results("Hamilton filter"):
+                    group_time = span_time(time_data, start, length)
+                    for i, var in enumerate(group_vars):
+                        save_data.add("ham", var, cycle=masked(var, cycle[:, i], shift),
+                                      trend=masked(var, trend[:, i], shift), offset=start + shift)
+                        if no_plots:
+                            continue
+                        result["hamilton_filter"][var] = {
+                            "cycle": cycle[:, i],
+                            "trend": trend[:, i]
+                        }
+                        create_hamilton_filter_output(charts, result, group_time, spans[var][1], var, ham_h, ham_p)
+
+            if (bk_filter or cf_filter) and not no_plots:
                 if is_set("bk_cf_variables"):
-                    low = get_value("low") or 6.0
-                    high = get_value("high") or 32.0
-                    k = get_value("k") or 12
-                    k = int(k)
-
-                    if low >= high:
-                        raise ValueError(f"low ({low}) must be less than high ({high})")
-
-                    if k <= 0:
-                        raise ValueError(f"K ({k}) must be a positive integer")
-
-                    result["bk_filter"] = {}
-
-                    for var in bk_cf_names:
-                        try:
-                            var_index = wraputil.get_index(fields, var)
-                            if var_index is not None:
-                                var_data = columns_data[var_index]
-                                ts_data = np.array(var_data)
-
-                                if len(ts_data) < 3:
-                                    log_error(f"Variable '{var}': Needs ≥3 data points")
-                                    continue
-                                if np.isnan(ts_data).any():
-                                    log_error(f"Variable '{var}': Contains NaN")
-                                    continue
-                                bk_filter_data = sm.tsa.filters.bkfilter(ts_data, low, high, K=k)
-                                result["bk_filter"][var] = bk_filter_data.tolist()
-                        except Exception as e:
-                            error_msg = f"Error processing variable '{var}': {str(e)}"
-                            log_error(error_msg)
-                            raise type(e)(error_msg) from e
-                    create_bk_filter_output(xtIntl, result, time_data, bk_filter_data, fields, output_json, bk_cf_names)
-
-
-            if cf_filter:
-                if is_set("bk_cf_variables"):
-   
-                    low = get_value("low")
-                    low = 6.0 if low is None else low
-                    high = get_value("high")
-                    high = 32.0 if high is None else high
-                    drift = get_value("drift")
-
-                    if low >= high:
-                        raise ValueError(f"low ({low}) must be less than high ({high})")
-
-                    result["cf_filter"] = {}
-                    
-                    for var in bk_cf_names:
-                        var_index = wraputil.get_index(fields, var)
-                        if var_index is not None:
-                            ts_data = np.array(columns_data[var_index])
-                            if len(ts_data) < 3:
-                                raise ValueError(f"Insufficient data points for {var}.")
-                            
-                            if np.any(np.isnan(ts_data)) or np.any(np.isinf(ts_data)):
-                                raise ValueError(f"{var} contains NaN or inf values, cannot apply CF filter.")
-                            
-                            if drift is not None:
-                                cycle, trend = sm.tsa.filters.cffilter(ts_data, low, high, drift=drift)
-                            else:
-                                cycle, trend = sm.tsa.filters.cffilter(ts_data, low, high)
-
+                    plotted = [var for var in bk_cf_names if var in spans]
+                    for (start, length), group_vars in group_by_span(plotted, spans).items():
+                        dataset_id = "bk_cf_series_data" if length == len(time_data) else \
+                            f"bk_cf_series_data ({start + 1}-{start + length})"
+                        create_bk_cf_series_output(charts, {var: spans[var][1] for var in group_vars},
+                                                   span_time(time_data, start, length), dataset_id)
+
+
+            if bk_filter and is_set("bk_cf_variables"):
+                result["bk_filter"] = {}
+
+                for (start, length), group_vars, bk_filter_data in plan.results("BK filter"):
+                    if spectrum:
+                        filter_cycles.append(("BK", (start, length), group_vars, bk_filter_data,
+                                              bk_weights(low, high, k)))
+                    for i, var in enumerate(group_vars):
+                        # The centered filter loses K observations at each end
+                        cycle = bk_filter_data[:, i]
+                        if missing_mask and spans[var][2] is not None:
+                            cycle = np.where(spans[var][2][k:len(cycle) + k], np.nan, cycle)
+                        save_data.add("bk", var, cycle=cycle, offset=start + k)
+                        if not no_plots:
+                            result["bk_filter"][var] = bk_filter_data[:, i]
+                    if not no_plots:
+                        dataset_id = "bk_filter_data" if length == len(time_data) else \
+                            f"bk_filter_data ({start + 1}-{start + length})"
+                        create_bk_filter_output(charts, result, span_time(time_data, start, length), group_vars,
+                                                dataset_id)
+
+
+            if cf_filter and is_set("bk_cf_variables"):
+                result["cf_filter"] = {}
+
+                for (start, length), group_vars, (cycle, trend) in plan.results("CF filter"):
+                    if spectrum:
+                        filter_cycles.append(("CF", (start, length), group_vars, cycle,
+                                              cf_center_weights(length, low, high)))
+                    for i, var in enumerate(group_vars):
+                        save_data.add("cf", var, cycle=masked(var, cycle[:, i]), trend=masked(var, trend[:, i]),
+                                      offset=start)
+                        if not no_plots:
                             result["cf_filter"][var] = {
-                                "cycle": cycle.tolist(),
-                                "trend": trend.tolist()
+                                "cycle": cycle[:, i],
+                                "trend": trend[:, i]
                             }
-                    create_cf_filter_output(xtIntl, result, time_data, fields, output_json, bk_cf_names)
+                    if not no_plots:
+                        dataset_id = "cf_filter_data" if length == len(time_data) else \
+                            f"cf_filter_data ({start + 1}-{start + length})"
+                        create_cf_filter_output(charts, result, span_time(time_data, start, length), group_vars,
+                                                dataset_id)
+
+            if filter_cycles:
+                with profiler.stage("Spectrum", len(time_data)):
+                    execute_spectrum(xtIntl, output_json, charts, plan, filter_cycles, low, high, no_plots)
+
+            if cache is not None:
+                output_json.add_notes(Notes(xtIntl.loadstring("cache_title"),
+                                            xtIntl.loadstring("cache_summary").format(cache.hits, cache.misses)))
+            if state is not None:
+                output_json.add_notes(Notes(xtIntl.loadstring("incremental_title"),
+                                            xtIntl.loadstring("incremental_summary").format(
+                                                state.updated, state.new_rows, state.recomputed)))
+
+            charts.finish()
+            with profiler.stage("Save", projection.rows):
+                output_data = save_data.get_output()
 
         except Exception as err:
             warning_item = Warnings(xtIntl.loadstring("python_returned_msg") + "\n" + repr(err))
@@ -201,469 +462,1490 @@ def execute(iterator_id, data_model, settings, lang="en"):
             notes = Notes(xtIntl.loadstring("python_output"), tb)
             output_json.add_notes(notes)
         finally:
+            if (float32_output or spill_bytes > 0) and pool.buffers:
+                saved = 100.0 * (1.0 - pool.in_memory / pool.float64_bytes) if pool.float64_bytes else 0.0
+                output_json.add_notes(Notes(xtIntl.loadstring("buffers_title"),
+                                            xtIntl.loadstring("buffers_summary").format(
+                                                pool.buffers, format_bytes(pool.in_memory),
+                                                format_bytes(pool.mapped), format_bytes(pool.float64_bytes), saved)))
+            profiler.report(xtIntl, output_json)
+            if output_data is not None:
+                save_output(output_data)
             generate_output(output_json.get_json(), None)
             finish()
+            pool.close()
 
     get_records(iterator_id, data_model, execute_model)
     return 0
 
 
-def create_hp_filter_output(xtIntl, result, time_data, hp_data, hp_variable, fields, output_json):
-    
-    # HP variable vs Time Data Plot
-    chart_title = xtIntl.loadstring("hp_variable_chart_title")+ f" {hp_variable}"
-    chart_x_label = xtIntl.loadstring("date_label")
-    chart_x_data = list(time_data)
-    chart_y_label = hp_variable
-    chart_y_data = hp_data
-
-    graph_dataset = "hp_filter_graph_data"
-    
-    hp_variable_chart = GplChart(chart_title)
-
-    gpl_statements = [
-        "SOURCE: s = userSource(id(\"{0}\"))".format(graph_dataset),
-        "DATA: x = col(source(s), name(\"x\"), unit.category())",
-        "DATA: y = col(source(s), name(\"y\"))",
-        "GUIDE: axis(dim(1), label(\"{0}\"))".format(chart_x_label),
-        "GUIDE: axis(dim(2), label(\"{0}\"))".format(chart_y_label),
-        "GUIDE: text.title(label(\"{0}\"))".format(chart_title),
-        "SCALE: cat(dim(1), sort.data())",
-        "SCALE: linear(dim(2))",
-        "ELEMENT: line(position(x*y),size(size.\"1pt\"))",
-    ]
-
-    hp_variable_chart.add_gpl_statement(gpl_statements)
-    hp_variable_chart.add_variable_mapping("x", chart_x_data, graph_dataset)
-    hp_variable_chart.add_variable_mapping("y", chart_y_data, graph_dataset)
-
-    output_json.add_chart(hp_variable_chart)
-    
-
-    #HP Filter Trends vs Time plot
-    hp_filter_results = result["hp_filter"]
-    cycle = hp_filter_results["cycle"]
-    trend = hp_filter_results["trend"]
+def get_records_per_chunk():
+    with open(properties_file, encoding="utf-8") as f:
+        backend_processing = json.load(f).get("backend_processing", {})
+    return int(backend_processing.get("records_per_chunk", -1))
+
+
+def get_hp_variables():
+    hp_names = get_value("hpvariable") or []
+    if isinstance(hp_names, str):
+        hp_names = [hp_names]
+    return hp_names
+
+
+def get_referenced_variables():
+    referenced = list(get_hp_variables())
+    if is_set("bk_cf_variables"):
+        referenced.extend(get_value("bk_cf_variables"))
+    return referenced
+
+
+def format_bytes(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024.0
+    return f"{size:.1f} {unit}"
+
+
+class ColumnBuffer:
+    """Growable float64 buffer that numeric columns are appended to chunk by chunk"""
+
+    def __init__(self, capacity):
+        self.data = np.empty(max(int(capacity), 1), dtype=np.float64)
+        self.size = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        end = self.size + len(values)
+        if end > len(self.data):
+            grown = np.empty(max(end, 2 * len(self.data)), dtype=np.float64)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:end] = values
+        self.size = end
+
+    def get_array(self):
+        return self.data[:self.size]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+
+class ColumnProjection:
+    """Decodes only the referenced fields of each record, straight into typed arrays"""
+
+    def __init__(self, fields, variables, label_indices):
+        self.field_count = len(fields)
+        # Label columns (time, panel id) keep their values as they are
+        self.label_indices = []
+        for label_index in label_indices:
+            if label_index is not None and label_index != -1 and label_index not in self.label_indices:
+                self.label_indices.append(label_index)
+        self.indices = []
+        for var in variables:
+            var_index = wraputil.get_index(fields, var)
+            if var_index is not None and var_index not in self.label_indices and var_index not in self.indices:
+                self.indices.append(var_index)
+        self.rows = 0
+
+    def decode(self, data):
+        count = len(data)
+        if hasattr(data, "column"):
+            # Hosts that hold the data by column, such as the batch runner, pass chunks with a
+            # column(index) method and skip the per row decode
+            columns = {index: np.asarray(data.column(index), dtype=np.float64) for index in self.indices}
+            columns.update((index, list(data.column(index))) for index in self.label_indices)
+            self.rows += count
+            return columns
+
+        columns = {}
+        for index in self.indices:
+            try:
+                columns[index] = np.fromiter((row[index] for row in data), dtype=np.float64, count=count)
+            except TypeError:
+                # Missing cells arrive as None, only columns that have them take the slower path
+                columns[index] = np.fromiter((np.nan if row[index] is None else row[index] for row in data),
+                                             dtype=np.float64, count=count)
+        for label_index in self.label_indices:
+            columns[label_index] = [row[label_index] for row in data]
+        self.rows += count
+        return columns
+
+    @property
+    def decoded_columns(self):
+        return len(self.indices) + len(self.label_indices)
+
+    @property
+    def skipped_columns(self):
+        return self.field_count - self.decoded_columns
+
+    @property
+    def skipped_cells(self):
+        return self.skipped_columns * self.rows
+
+
+class ColumnStream:
+    """Collects the projected columns of a chunked record stream"""
+
+    def __init__(self, projection, chunk_size):
+        self.projection = projection
+        self.buffers = {index: ColumnBuffer(chunk_size) for index in projection.indices}
+        self.labels = {index: [] for index in projection.label_indices}
+        self.rows = 0
+        self.chunks = 0
+        self.peak_bytes = 0
+        self.finished = False
+        self.error = None
+
+    def append(self, data):
+        columns = self.projection.decode(data)
+        for index, buffer in self.buffers.items():
+            buffer.extend(columns[index])
+        for index, values in self.labels.items():
+            values.extend(columns[index])
+
+        self.rows += len(data)
+        self.chunks += 1
+        self.peak_bytes = max(self.peak_bytes, sum(buffer.nbytes for buffer in self.buffers.values()))
+
+    def get_columns(self):
+        columns = {index: buffer.get_array() for index, buffer in self.buffers.items()}
+        columns.update(self.labels)
+        return columns
+
+
+MISSING_METHODS = ("reject", "linear", "spline")
+
+
+def handle_missing(column, method="linear", trim=True):
+    # Returns (start, values, mask) for the part of the column that is filtered: leading and
+    # trailing gaps are trimmed, interior gaps interpolated and flagged in the mask
+    column = np.asarray(column, dtype=np.float64)
+    valid = np.isfinite(column)
+    if valid.all():
+        return 0, column, None
+    if not valid.any():
+        raise ValueError("has no valid values")
+
+    start = int(np.argmax(valid))
+    stop = len(column) - int(np.argmax(valid[::-1]))
+    if not trim and (start > 0 or stop < len(column)):
+        raise ValueError("has missing values at the start or end of the series")
+    values = column[start:stop]
+    valid = valid[start:stop]
+    if valid.all():
+        return start, values, None
+    if method == "reject":
+        raise ValueError("contains NaN or inf values")
+
+    positions = np.flatnonzero(valid)
+    gaps = np.flatnonzero(~valid)
+    values = values.copy()
+    if method == "spline" and len(positions) >= 4:
+        from scipy.interpolate import CubicSpline
+        values[gaps] = CubicSpline(positions, values[positions])(gaps)
+    else:
+        values[gaps] = np.interp(gaps, positions, values[positions])
+    return start, values, ~valid
+
+
+def group_by_span(names, spans):
+    # Variables that cover the same rows are filtered together as one (n x k) stack
+    groups = OrderedDict()
+    for var in names:
+        start, values, _ = spans[var]
+        groups.setdefault((start, len(values)), []).append(var)
+    return groups
+
+
+def span_time(time_data, start, length):
+    if start == 0 and length == len(time_data):
+        return time_data
+    return time_data[start:start + length]
+
+
+class ExecutionPlan:
+    """Filter stages of a run; the variables of each span group share one float64 matrix"""
+
+    def __init__(self, spans):
+        self.spans = spans
+        self.columns = OrderedDict()
+        self.matrices = {}
+        self.tasks = []
+
+    def add(self, stage, names, run=None):
+        # run(data, names) is called on a worker thread; stages without one run on the main thread
+        for span, group_vars in group_by_span(names, self.spans).items():
+            columns = self.columns.setdefault(span, [])
+            columns.extend(var for var in group_vars if var not in columns)
+            self.tasks.append({"stage": stage, "span": span, "names": group_vars, "run": run,
+                               "result": None, "error": None})
+
+    def stack(self, pool):
+        for span, columns in self.columns.items():
+            self.matrices[span] = pool.stack([self.spans[var][1] for var in columns])
+
+    def data(self, span, names):
+        # A view when the names are adjacent columns of the shared matrix, a copy otherwise
+        columns = self.columns[span]
+        first = columns.index(names[0])
+        if columns[first:first + len(names)] == names:
+            return self.matrices[span][:, first:first + len(names)]
+        return self.matrices[span][:, [columns.index(var) for var in names]]
+
+    def execute(self, task):
+        # Errors are kept and raised when the stage's results are read, in plan order
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            task["result"] = task["run"](self.data(task["span"], task["names"]), task["names"])
+        except Exception as err:
+            task["error"] = err
+        return time.perf_counter() - wall, time.thread_time() - cpu
+
+    def workers(self, threads):
+        return max(min(threads, sum(task["run"] is not None for task in self.tasks)), 1)
+
+    def run(self, threads):
+        tasks = [task for task in self.tasks if task["run"] is not None]
+        workers = self.workers(threads)
+        if workers <= 1:
+            for task in tasks:
+                with profiler.stage(task["stage"], task["span"][1]):
+                    self.execute(task)
+            return
 
-    trend_title = xtIntl.loadstring("hp_filter_trend_title")
-    trend_x_label = xtIntl.loadstring("date_label")
-    trend_x_data = list(time_data)
-    trend_y_label = xtIntl.loadstring("trend_label")
+        from concurrent.futures import ThreadPoolExecutor
+
+        # The engines spend their time in NumPy/SciPy kernels that release the GIL
+        with profiler.stage("Filters", max(task["span"][1] for task in tasks)):
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                timings = list(executor.map(self.execute, tasks))
+        for task, (wall, cpu) in zip(tasks, timings):
+            profiler.record(task["stage"], task["span"][1], wall, cpu)
+
+    def results(self, stage):
+        for task in self.tasks:
+            if task["stage"] == stage:
+                if task["error"] is not None:
+                    raise task["error"]
+                yield task["span"], task["names"], task["result"]
+
+    def report(self, xtIntl, threads, stages=()):
+        # Table of the planned stages for OPTIONS DRYRUN, one row per step in the order they run
+        main = xtIntl.loadstring("main_thread_label")
+        workers = self.workers(threads)
+        on_pool = xtIntl.loadstring("thread_pool_label").format(workers) if workers > 1 else main
+        rows = [["Convert", length, ", ".join(columns), format_bytes(8 * length * len(columns)), main]
+                for (_, length), columns in self.columns.items()]
+        rows += [[task["stage"], task["span"][1], ", ".join(task["names"]), "",
+                  main if task["run"] is None else on_pool] for task in self.tasks]
+        rows += [[stage, stage_rows, "", "", main] for stage, stage_rows in stages]
+        return plan_table(xtIntl, rows, xtIntl.loadstring("plan_summary").format(
+            sum(task["run"] is not None for task in self.tasks), len(self.columns), workers))
+
+
+class TextTable:
+    """Fixed width text version of util.statjson's Table for hosts without pivot tables"""
+
+    def __init__(self, title, template_name=None):
+        self.title = title
+        self.template_name = template_name
+        self.decimals = None
+        self.row_dimensions = []
+        self.column_dimensions = []
+        self.cells = []
+        self.footnotes = []
+
+    def set_default_cell_format(self, decimals=None):
+        self.decimals = decimals
+
+    def add_row_dimension(self, name, labels):
+        self.row_dimensions.append((name, list(labels)))
+
+    def add_column_dimensions(self, name, labels):
+        self.column_dimensions.append((name, list(labels)))
+
+    def add_cells(self, cells):
+        self.cells.extend(cells)
+
+    def add_footnotes(self, text):
+        self.footnotes.append(text)
+
+    def format_cell(self, cell):
+        value = getattr(cell, "value", cell)
+        decimals = getattr(cell, "decimals", None)
+        decimals = self.decimals if decimals is None else decimals
+        if value is None:
+            return ""
+        if isinstance(value, str):
+            return value
+        return f"{float(value):.{decimals}f}" if decimals is not None else f"{float(value):g}"
+
+    def get_text(self):
+        # One line per combination of the row labels, the column labels of all column dimensions in the header
+        header = [name for name, _ in self.row_dimensions]
+        for labels in itertools.product(*[labels for _, labels in self.column_dimensions]):
+            header.append(" ".join(labels))
+        columns = len(header) - len(self.row_dimensions)
+        row_labels = list(itertools.product(*[labels for _, labels in self.row_dimensions]))
+        rows = [list(labels) + [self.format_cell(cell) for cell in self.cells[i * columns:(i + 1) * columns]]
+                for i, labels in enumerate(row_labels)]
+        return "\n\n".join([format_text_table(header, rows)] + self.footnotes)
+
+
+def format_text_table(header, rows):
+    # Fixed width text table for the output notes
+    cells = [header] + [[str(cell) for cell in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(header))]
+    lines = ["  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in cells]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def new_table(title, template_name):
+    return Table(title, template_name) if PIVOT_TABLES else TextTable(title, template_name)
+
+
+def add_table(output_json, table):
+    if isinstance(table, TextTable):
+        output_json.add_notes(Notes(table.title, table.get_text()))
+    else:
+        output_json.add_table(table)
+
+
+def plan_table(xtIntl, rows, footnote):
+    # rows are [stage, rows, variables, matrix, runs on], one per step in the order they run
+    table = new_table(xtIntl.loadstring("plan_title"), "Execution Plan")
+    table.add_row_dimension(xtIntl.loadstring("step_label"), [str(step) for step in range(1, len(rows) + 1)])
+    table.add_column_dimensions(xtIntl.loadstring("statistics_label"), [xtIntl.loadstring(key) for key in (
+        "stage_label", "rows_label", "variables_label", "matrix_label", "runs_on_label")])
+    for stage, stage_rows, names, matrix, runs_on in rows:
+        table.add_cells([stage, Cell(stage_rows, 0), names or None, matrix or None, runs_on])
+    table.add_footnotes(footnote)
+    return table
+
+
+class BufferPool:
+    """Large working and output matrices of a run, spilled to np.memmap scratch files above a threshold"""
+
+    def __init__(self, spill_bytes=0, directory=None):
+        self.spill_bytes = spill_bytes
+        self.directory = directory or tempfile.gettempdir()
+        self.scratch = None
+        self.buffers = 0
+        self.in_memory = 0
+        self.mapped = 0
+        self.float64_bytes = 0
+
+    def empty(self, shape, dtype=np.float64):
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape))
+        nbytes = size * dtype.itemsize
+        self.buffers += 1
+        self.float64_bytes += size * 8
+        if self.spill_bytes > 0 and nbytes >= self.spill_bytes:
+            if self.scratch is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self.scratch = tempfile.mkdtemp(prefix="tsf_buffers_", dir=self.directory)
+            self.mapped += nbytes
+            path = os.path.join(self.scratch, f"buffer{self.buffers}.dat")
+            return np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+        self.in_memory += nbytes
+        return np.empty(shape, dtype=dtype)
+
+    def stack(self, columns):
+        # One (n x k) float64 matrix filled column by column, without a list or transposed copy
+        matrix = self.empty((len(columns[0]), len(columns)))
+        for i, column in enumerate(columns):
+            matrix[:, i] = column
+        return matrix
+
+    def close(self):
+        # Mapped files that are still open (Windows) are left to the temp directory cleanup
+        if self.scratch is not None:
+            shutil.rmtree(self.scratch, ignore_errors=True)
+            self.scratch = None
+
+
+class SaveData:
+    """Filter results that are handed to save_output as new variables"""
+
+    def __init__(self, rows, save_trend, save_cycle, pool=None, dtype=np.float64):
+        self.rows = rows
+        self.save_trend = bool(save_trend)
+        self.save_cycle = bool(save_cycle)
+        self.pool = pool or BufferPool()
+        self.dtype = dtype
+        self.columns = {}
+
+    def add(self, filter_name, var, cycle=None, trend=None, rows=None, offset=0):
+        if self.save_cycle and cycle is not None:
+            self.add_column(f"{var}_{filter_name}_cycle", cycle, rows, offset)
+        if self.save_trend and trend is not None:
+            self.add_column(f"{var}_{filter_name}_trend", trend, rows, offset)
+
+    def add_column(self, name, values, rows=None, offset=0):
+        # Only references are kept; the values are written once into the output matrix
+        self.columns.setdefault(name, []).append((values, rows, offset))
+
+    def get_output(self):
+        if not self.columns:
+            return None
+        data = self.pool.empty((self.rows, len(self.columns)), self.dtype)
+        for i, segments in enumerate(self.columns.values()):
+            column = data[:, i]
+            values, rows, offset = segments[0]
+            # Results of a panel group land on that group's rows; unfiltered positions stay missing
+            if len(segments) > 1 or rows is not None or offset != 0 or len(values) != self.rows:
+                column[:] = np.nan
+            for values, rows, offset in segments:
+                if rows is None:
+                    column[offset:offset + len(values)] = values
+                else:
+                    column[rows[offset:offset + len(values)]] = values
+        return {
+            "fields": [{"name": name, "type": "double"} for name in self.columns],
+            "data": data
+        }
+
+
+class ResultCache:
+    """On-disk LRU cache of filter results keyed by the input column bytes and the filter settings"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Filters of one run may share the cache from several threads
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, filter_name, column, params):
+        column = np.ascontiguousarray(column, dtype=np.float64)
+        digest = hashlib.blake2b(column.tobytes(), digest_size=16)
+        digest.update(repr((filter_name, len(column), tuple(float(p) for p in params))).encode("utf-8"))
+        return f"{filter_name}_{digest.hexdigest()}"
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            parts = np.load(path)
+            # Touch the entry so eviction sees it as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return tuple(parts[:, i] for i in range(parts.shape[1]))
+
+    def put(self, key, parts):
+        path = self.path(key)
+        scratch = path + ".tmp.npy"
+        try:
+            np.save(scratch, np.column_stack(parts))
+            os.replace(scratch, path)
+            with self.lock:
+                self.evict()
+        except OSError as err:
+            log_error(f"Could not write the result cache entry {path}: {err!r}")
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy") and not name.endswith(".tmp.npy"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+
+def run_cached(cache, filter_name, engine, data, params):
+    # Runs engine(data, *params) on the (n x k) data, skipping the columns found in the cache
+    if cache is None:
+        return engine(data, *params)
+
+    keys = [cache.key(filter_name, data[:, i], params) for i in range(data.shape[1])]
+    results = [cache.get(key) for key in keys]
+    missing = [i for i, parts in enumerate(results) if parts is None]
+    if missing:
+        computed = engine(data[:, missing], *params)
+        computed = computed if isinstance(computed, tuple) else (computed,)
+        for j, i in enumerate(missing):
+            results[i] = tuple(part[:, j] for part in computed)
+            cache.put(keys[i], results[i])
+
+    parts = tuple(np.column_stack([result[p] for result in results]) for p in range(len(results[0])))
+    return parts if len(parts) > 1 else parts[0]
+
+
+class IncrementalState:
+    """Filter state saved per series so a run on appended rows only recomputes the tail"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.updated = 0
+        self.recomputed = 0
+        self.new_rows = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, filter_name, var, params):
+        digest = hashlib.blake2b(repr((filter_name, var, tuple(float(p) for p in params))).encode("utf-8"),
+                                 digest_size=16)
+        return os.path.join(self.directory, f"{filter_name}_{digest.hexdigest()}.npz")
+
+    def run(self, filter_name, var, column, params, engine, update):
+        # Reuses the saved outputs when the saved rows are an unchanged prefix of the column
+        path = self.path(filter_name, var, params)
+        column = np.ascontiguousarray(column, dtype=np.float64)
+        digest = hashlib.blake2b(digest_size=16)
+        parts = None
+        try:
+            with np.load(path) as saved:
+                rows = int(saved["rows"])
+                if rows <= len(column):
+                    digest.update(column[:rows].tobytes())
+                    if digest.hexdigest() == str(saved["digest"]):
+                        parts = update(column, rows, tuple(saved[f"part{i}"] for i in range(int(saved["parts"]))),
+                                       *params)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if parts is None:
+            digest = hashlib.blake2b(digest_size=16)
+            rows = 0
+            parts = engine(column, *params)
+            with self.lock:
+                self.recomputed += 1
+        else:
+            with self.lock:
+                self.updated += 1
+                self.new_rows += len(column) - rows
+        parts = parts if isinstance(parts, tuple) else (parts,)
 
-    graph_dataset = "hp_filter_trend_data"
+        digest.update(column[rows:].tobytes())
+        scratch = path + ".tmp.npz"
+        try:
+            np.savez(scratch, rows=len(column), digest=digest.hexdigest(), parts=len(parts),
+                     **{f"part{i}": part for i, part in enumerate(parts)})
+            os.replace(scratch, path)
+        except OSError as err:
+            log_error(f"Could not write the incremental state {path}: {err!r}")
+        return parts
+
+
+def run_incremental(state, filter_name, engine, update, data, names, params):
+    # Same contract as run_cached, but each column keeps its own saved state keyed by variable
+    results = [state.run(filter_name, var, data[:, i], params, engine, update) for i, var in enumerate(names)]
+    parts = tuple(np.column_stack([result[p] for result in results]) for p in range(len(results[0])))
+    return parts if len(parts) > 1 else parts[0]
+
+
+class StageProfiler:
+    """Wall time, CPU time, peak allocated bytes and rows per stage of a run, for OPTIONS PROFILE"""
+
+    def __init__(self):
+        self.reset(False)
+
+    def reset(self, enabled, log_path=None):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.stages = {}
+        self.stack = []
+        self.started_tracing = False
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        # A stage entered again while it is running, e.g. charts drawn from the panel mode, counts once
+        if not self.enabled or any(frame["name"] == name for frame in self.stack):
+            yield
+            return
 
-    hp_filter_trend_chart = GplChart(trend_title)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        current, peak = tracemalloc.get_traced_memory()
+        if self.stack:
+            self.stack[-1]["peak"] = max(self.stack[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        frame = {"name": name, "start": current, "peak": current}
+        self.stack.append(frame)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1]["peak"] = max(self.stack[-1]["peak"], peak)
+            self.record(name, rows, wall, cpu, peak - frame["start"])
+
+    def record(self, name, rows, wall, cpu, allocated=0):
+        # Also called from the main thread for stages timed on worker threads
+        if not self.enabled:
+            return
+        totals = self.stages.setdefault(name, {"calls": 0, "rows": 0, "wall": 0.0, "cpu": 0.0, "bytes": 0})
+        totals["calls"] += 1
+        totals["rows"] = max(totals["rows"], rows or 0)
+        totals["wall"] += wall
+        totals["cpu"] += cpu
+        totals["bytes"] = max(totals["bytes"], allocated)
+
+    def report(self, xtIntl, output_json):
+        if not self.enabled:
+            return
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        if not self.stages:
+            return
 
-    gpl_statements = [
-        "SOURCE: s = userSource(id(\"{0}\"))".format(graph_dataset),
-        "DATA: x = col(source(s), name(\"x\"), unit.category())",
-        "DATA: y = col(source(s), name(\"y\"))",
-        "GUIDE: axis(dim(1), label(\"{0}\"))".format(trend_x_label),
-        "GUIDE: axis(dim(2), label(\"{0}\"))".format(trend_y_label),
-        "GUIDE: text.title(label(\"{0}\"))".format(trend_title),
-        "SCALE: cat(dim(1), sort.data())",
-        "SCALE: linear(dim(2))",
-        "ELEMENT: line(position(x*y),size(size.\"1pt\"))",
-    ]
+        table = new_table(xtIntl.loadstring("profile_title"), "Profile")
+        table.add_row_dimension(xtIntl.loadstring("stage_label"), self.stages.keys())
+        table.add_column_dimensions(xtIntl.loadstring("statistics_label"), [xtIntl.loadstring(key) for key in (
+            "calls_label", "rows_label", "wall_time_label", "cpu_time_label", "allocated_label")])
+        for totals in self.stages.values():
+            table.add_cells([Cell(totals["calls"], 0), Cell(totals["rows"] or None, 0), Cell(totals["wall"], 4),
+                             Cell(totals["cpu"], 4), format_bytes(totals["bytes"])])
+        add_table(output_json, table)
+
+        if self.log_path:
+            # One JSON object per stage, appended so consecutive runs can be compared
+            run = time.strftime("%Y-%m-%dT%H:%M:%S")
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as log:
+                    for name, totals in self.stages.items():
+                        log.write(json.dumps({"run": run, "stage": name, "calls": totals["calls"],
+                                              "rows": totals["rows"], "wall_seconds": totals["wall"],
+                                              "cpu_seconds": totals["cpu"], "allocated_bytes": totals["bytes"]})
+                                  + "\n")
+            except OSError as err:
+                log_error(f"Could not write the profile log {self.log_path}: {err!r}")
+
+
+profiler = StageProfiler()
+
+
+def profiled(name):
+    # Charges every call of the decorated function to a profiler stage
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with profiler.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def execute_lambda_sweep(xtIntl, ts_data, hp_vars, lambdas, output_json, save_data, one_sided=False, offset=0,
+                         masked=None):
+    # One summary row per variable and lambda instead of a full set of charts per lambda; masked
+    # blanks the saved values at interpolated points of MISSING MASK=TRUE
+    masked = masked or (lambda var, values: values)
+    cells = {var: [] for var in hp_vars}
+    prefix = "hprt" if one_sided else "hp"
+    for lamb, cycle, trend in hp_sweep_engine(ts_data, lambdas, one_sided):
+        cycle_variance = cycle.var(axis=0, ddof=1)
+        smoothness = np.mean(np.diff(trend, n=2, axis=0) ** 2, axis=0)
+        lambda_label = f"{lamb:g}".replace(".", "_").replace("+", "")
+        for i, var in enumerate(hp_vars):
+            cells[var] += [cycle_variance[i], smoothness[i]]
+            save_data.add(f"{prefix}{lambda_label}", var, cycle=masked(var, cycle[:, i]),
+                          trend=masked(var, trend[:, i]), offset=offset)
+
+    table = new_table(xtIntl.loadstring("lambda_sweep_title"), "Lambda Sweep")
+    table.add_row_dimension(xtIntl.loadstring("variable_label"), hp_vars)
+    table.add_row_dimension("Lambda", [f"{lamb:g}" for lamb in lambdas])
+    table.add_column_dimensions(xtIntl.loadstring("statistics_label"), [
+        xtIntl.loadstring("cycle_variance_label"), xtIntl.loadstring("trend_smoothness_label")])
+    for var in hp_vars:
+        table.add_cells(cells[var])
+    add_table(output_json, table)
+
+
+def periodogram(x, nfft):
+    # Periodogram of every column of x (n,) or (n, k) from one real FFT; shorter columns are
+    # zero padded to nfft so they share the Fourier frequencies of the full span
+    x = np.asarray(x, dtype=np.float64)
+    spectrum = np.fft.rfft(x - x.mean(axis=0), n=nfft, axis=0)
+    return (spectrum.real ** 2 + spectrum.imag ** 2) / x.shape[0]
+
+
+def cf_center_weights(n, low, high):
+    # Symmetric CF weights of the middle observation, the part of the sample away from the end corrections
+    bj = cf_weights(n, low, high)[:(n - 1) // 2 + 1]
+    return np.r_[bj[:0:-1], bj]
+
+
+def execute_spectrum(xtIntl, output_json, charts, plan, filter_cycles, low, high, no_plots):
+    # filter_cycles holds (label, span, names, cycles, weights) for each BK/CF stage result; the raw
+    # columns of a span group and each stage's cycles take one batched FFT, the gains one more each
+    groups = OrderedDict()
+    for label, span, names, cycles, weights in filter_cycles:
+        groups.setdefault(span, []).append((label, names, cycles, weights))
+
+    cells = {}
+    title = xtIntl.loadstring("spectrum_chart_title")
+    y_label = xtIntl.loadstring("relative_power_label")
+    footnote = xtIntl.loadstring("spectrum_footnote").format(low, high)
+    for (start, length), stages in groups.items():
+        frequencies = np.fft.rfftfreq(length)
+        band = (frequencies >= 1.0 / high) & (frequencies <= 1.0 / low)
+        dataset_id = "spectrum_data" if len(groups) == 1 else f"spectrum_data ({start + 1}-{start + length})"
+        dataset = charts.dataset(dataset_id, frequencies.tolist(), xtIntl.loadstring("frequency_label"))
+
+        names = list(dict.fromkeys(var for _, group_vars, _, _ in stages for var in group_vars))
+        series = [(var, "Raw", power) for var, power in zip(names, periodogram(plan.data((start, length), names),
+                                                                               length).T)]
+        gains = {}
+        for label, group_vars, cycles, weights in stages:
+            gains[label] = np.abs(np.fft.rfft(weights, n=length))
+            series += [(var, f"{label} cycle", power) for var, power in zip(group_vars, periodogram(cycles, length).T)]
+
+        lines = {var: [] for var in names}
+        series.sort(key=lambda item: names.index(item[0]))
+        for var, name, power in series:
+            # The zero frequency is left out, the means were removed
+            total = power[1:].sum()
+            peak = int(np.argmax(power[1:])) + 1
+            cells[var, name] = [Cell(100.0 * power[band].sum() / total, 1), 1.0 / frequencies[peak]] \
+                if total > 0 else [None, None]
+            if not no_plots:
+                scale = power.max()
+                lines[var].append((dataset.add_column(f"{var} {name}", power / scale if scale > 0 else power),
+                                   var if name == "Raw" else name))
+                if name != "Raw":
+                    label = name.split()[0]
+                    lines[var].append((dataset.add_column(f"{label} gain", gains[label]), f"{label} gain"))
+
+        if not no_plots:
+            for var in names:
+                charts.add_line_chart(f"{title} {var}", dataset, lines[var], y_label, subfootnote=footnote)
+
+    # Variables that are not in every BK/CF stage get empty cells for the other stages' cycles
+    names = list(dict.fromkeys(var for var, _ in cells))
+    series = ["Raw"] + list(dict.fromkeys(f"{label} cycle" for label, _, _, _, _ in filter_cycles))
+    table = new_table(xtIntl.loadstring("spectrum_title"), "Spectral Diagnostics")
+    table.add_row_dimension(xtIntl.loadstring("variable_label"), names)
+    table.add_row_dimension(xtIntl.loadstring("series_label"), series)
+    table.add_column_dimensions(xtIntl.loadstring("statistics_label"), [
+        xtIntl.loadstring("band_power_label"), xtIntl.loadstring("peak_period_label")])
+    for var in names:
+        for name in series:
+            table.add_cells(cells.get((var, name), [None, None]))
+    table.add_footnotes(footnote)
+    add_table(output_json, table)
+
+
+def get_missing_settings():
+    missing_method = str(get_value("missing_method") or "linear").lower()
+    if missing_method not in MISSING_METHODS:
+        raise ValueError(f"Unknown MISSING METHOD {missing_method}")
+    return missing_method, get_value("missing_trim") is not False, bool(get_value("missing_mask"))
+
+
+def get_lambdas():
+    # LAMBDARANGE=first last count gives count values spaced evenly on a log scale and replaces LAMBDA
+    lambda_range = get_value("lamb_range")
+    if lambda_range is not None and lambda_range != "" and lambda_range != []:
+        if len(lambda_range) != 3:
+            raise ValueError(f"LAMBDARANGE needs a first value, a last value and a count, not {lambda_range}")
+        first, last, count = lambda_range
+        if first <= 0 or last <= 0 or count != int(count) or count < 2:
+            raise ValueError(f"LAMBDARANGE values must be positive and the count an integer of at least 2, "
+                             f"not {lambda_range}")
+        return [float(f"{lamb:.6g}") for lamb in np.geomspace(first, last, int(count))]
+    lambdas = get_value("lamb")
+    if lambdas is None or lambdas == "" or lambdas == []:
+        return [1600]
+    if not isinstance(lambdas, (list, tuple)):
+        return [lambdas]
+    return lambdas
+
+
+def get_hamilton_settings():
+    h = int(get_value("hamilton_h") or 8)
+    p = int(get_value("hamilton_p") or 4)
+    if h < 1 or p < 1:
+        raise ValueError(f"Hamilton H ({h}) and P ({p}) must be positive integers")
+    return h, p
+
+
+def get_band_settings():
+    low = get_value("low")
+    low = 6.0 if low is None or low == "" else low
+    high = get_value("high")
+    high = 32.0 if high is None or high == "" else high
+    k = int(get_value("k") or 12)
+    drift = get_value("drift")
+    drift = True if drift is None else drift
+    return low, high, k, drift
+
+
+def is_missing_label(value):
+    # Missing string values arrive as None, missing numbers as None or NaN
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def partition_rows(group_values):
+    # Row indices of each group, groups in order of first appearance and rows in data order
+    keys = np.asarray(group_values)
+    group_ids, first_rows, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(group_ids))
+    rows = np.split(np.argsort(inverse, kind="stable"), np.cumsum(counts)[:-1])
+    order = np.argsort(first_rows)
+    group_ids = group_ids.tolist()
+    return [group_ids[i] for i in order], [rows[i] for i in order]
+
+
+def run_panel_tasks(tasks, workers):
+    # Returns the group results and the number of processes that filtered them
+    if workers <= 1 or len(tasks) <= 1:
+        return [filter_panel_group(task) for task in tasks], 1
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    # Workers are started with spawn on every platform, as on Windows and macOS, and only import
+    # tsf_engines, so they never load the host modules
+    chunksize = max(1, len(tasks) // (workers * 4))
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            return list(executor.map(filter_panel_group, tasks, chunksize=chunksize)), workers
+    except (OSError, BrokenProcessPool) as err:
+        log_error(f"Worker processes are not available, filtering the groups serially: {err!r}")
+        return [filter_panel_group(task) for task in tasks], 1
+
+
+def execute_panel_model(xtIntl, columns_data, time_data, fields, hp_names, lamda, bk_cf_names, output_json,
+                        charts, save_data, no_plots, one_sided=False, dry_run=False):
+    panel_variable = get_value("panel_variable")
+    panel_index = wraputil.get_index(fields, panel_variable)
+    if panel_index is None:
+        raise ValueError(f"Panel variable {panel_variable} was not found.")
+
+    workers = int(get_value("panel_workers") or 0)
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    chart_groups = get_value("panel_charts")
+    chart_groups = 5 if chart_groups is None else int(chart_groups)
+    if no_plots:
+        chart_groups = 0
+
+    filter_settings = {}
+    hp_vars = [var for var in hp_names if wraputil.get_index(fields, var) is not None]
+    if hp_filter and hp_vars:
+        filter_settings["hp_filter"] = (hp_vars, lamda, hp_onesided_engine if one_sided else hp_filter_engine)
+    if hamilton_filter and hp_vars:
+        filter_settings["hamilton_filter"] = (hp_vars, *get_hamilton_settings())
+
+    bk_cf_vars = [var for var in bk_cf_names if wraputil.get_index(fields, var) is not None]
+    if (bk_filter or cf_filter) and bk_cf_vars:
+        low, high, k, drift = get_band_settings()
+        if low >= high:
+            raise ValueError(f"low ({low}) must be less than high ({high})")
+        if bk_filter:
+            if k <= 0:
+                raise ValueError(f"K ({k}) must be a positive integer")
+            filter_settings["bk_filter"] = (bk_cf_vars, low, high, k)
+        if cf_filter:
+            filter_settings["cf_filter"] = (bk_cf_vars, low, high, drift)
+
+    names = []
+    for settings in filter_settings.values():
+        names.extend(var for var in settings[0] if var not in names)
+    values = {var: np.asarray(columns_data[wraputil.get_index(fields, var)], dtype=np.float64) for var in names}
+
+    # Rows without a panel id belong to no group; their saved results stay missing
+    panel_ids = columns_data[panel_index]
+    kept = np.flatnonzero([not is_missing_label(value) for value in panel_ids])
+    if len(kept) < len(panel_ids):
+        output_json.add_notes(Notes(xtIntl.loadstring("missing_title"), xtIntl.loadstring(
+            "panel_missing_ids").format(len(panel_ids) - len(kept), panel_variable)))
+    group_ids, group_rows = partition_rows([panel_ids[i] for i in kept])
+    group_rows = [kept[rows] for rows in group_rows]
+
+    # The MISSING stage runs on each group's rows: gaps are trimmed and interpolated per group, and a
+    # variable it rejects is left out of that group only
+    missing_method, missing_trim, missing_mask = get_missing_settings()
+    group_spans = []
+    tasks = []
+    gaps = {var: [0, 0] for var in names}
+    for group_id, rows in zip(group_ids, group_rows):
+        spans = {}
+        for var in names:
+            try:
+                spans[var] = handle_missing(values[var][rows], missing_method, missing_trim)
+            except ValueError as err:
+                log_error(f"Variable '{var}' {err} in group {group_id}, it is not filtered in that group.")
+                continue
+            start, span_values, mask = spans[var]
+            gaps[var][0] += len(rows) - len(span_values)
+            gaps[var][1] += 0 if mask is None else int(mask.sum())
+        group_settings = {}
+        for filter_name, settings in filter_settings.items():
+            filter_vars = [var for var in settings[0] if var in spans]
+            if filter_vars:
+                group_settings[filter_name] = (filter_vars,) + settings[1:]
+        group_spans.append(spans)
+        tasks.append(({var: span[1] for var, span in spans.items()}, group_settings))
+    gap_rows = [xtIntl.loadstring("missing_summary").format(var, trimmed, filled)
+                for var, (trimmed, filled) in gaps.items() if trimmed or filled]
+    if gap_rows:
+        output_json.add_notes(Notes(xtIntl.loadstring("missing_title"), "\n".join(gap_rows)))
+
+    if dry_run:
+        add_table(output_json, panel_plan_report(xtIntl, group_rows, tasks, workers, min(chart_groups, len(group_ids)),
+                                                 save_data.save_trend or save_data.save_cycle))
+        return None
+
+    group_results, workers = run_panel_tasks(tasks, workers)
+
+    output_json.add_notes(Notes(xtIntl.loadstring("panel_title"),
+                                xtIntl.loadstring("panel_summary").format(
+                                    panel_variable, len(group_ids), workers, min(chart_groups, len(group_ids)))))
+
+    prefix = "hprt" if one_sided else "hp"
+    for rows, spans, group_result in zip(group_rows, group_spans, group_results):
+        def masked(var, result, offset=0):
+            # Results at interpolated points of MISSING MASK=TRUE are saved as missing
+            mask = spans[var][2]
+            if not missing_mask or mask is None:
+                return result
+            return {part: np.where(mask[offset:offset + len(values)], np.nan, values)
+                    for part, values in result.items()}
+
+        for var, var_result in group_result.get("hp_filter", {}).items():
+            save_data.add(prefix, var, rows=rows, offset=spans[var][0], **masked(var, var_result))
+        for var, var_result in group_result.get("hamilton_filter", {}).items():
+            shift = sum(filter_settings["hamilton_filter"][1:]) - 1
+            save_data.add("ham", var, rows=rows, offset=spans[var][0] + shift, **masked(var, var_result, shift))
+        for var, cycle in group_result.get("bk_filter", {}).items():
+            k = filter_settings["bk_filter"][3]
+            save_data.add("bk", var, rows=rows, offset=spans[var][0] + k, **masked(var, {"cycle": cycle}, k))
+        for var, var_result in group_result.get("cf_filter", {}).items():
+            save_data.add("cf", var, rows=rows, offset=spans[var][0], **masked(var, var_result))
+
+    time_is_column = isinstance(time_data, (list, np.ndarray)) and len(time_data) == len(panel_ids)
+    for group_id, rows, spans, group_result in zip(group_ids[:chart_groups], group_rows, group_spans,
+                                                   group_results):
+        if time_is_column:
+            group_time = [time_data[i] for i in rows]
+        else:
+            group_time = list(time_data[:len(rows)])
+        create_panel_group_output(charts, group_id, group_result, group_time, spans,
+                                  xtIntl.loadstring("hp_onesided_footnote") if one_sided else None,
+                                  filter_settings.get("hamilton_filter", (None,))[1:])
+
+    return group_ids, group_rows, group_results
+
+
+PANEL_STAGES = {"hp_filter": "HP filter", "hamilton_filter": "Hamilton filter", "bk_filter": "BK filter",
+                "cf_filter": "CF filter"}
+
+
+def panel_plan_report(xtIntl, group_rows, tasks, workers, chart_groups, saving):
+    # OPTIONS DRYRUN with PANEL: one row per filter over all groups it runs in, then charts and save
+    main = xtIntl.loadstring("main_thread_label")
+    workers = min(workers, len(tasks)) if len(tasks) > 1 else 1
+    runs_on = xtIntl.loadstring("process_pool_label").format(workers) if workers > 1 else main
+    total = sum(len(rows) for rows in group_rows)
+    steps = [["Partition", total, "", "", main]]
+    for filter_name, stage in PANEL_STAGES.items():
+        stage_rows = 0
+        names = []
+        for rows, (_, group_settings) in zip(group_rows, tasks):
+            if filter_name in group_settings:
+                stage_rows += len(rows)
+                names.extend(var for var in group_settings[filter_name][0] if var not in names)
+        if names:
+            steps.append([stage, stage_rows, ", ".join(names), "", runs_on])
+    if chart_groups:
+        steps.append(["Charts", sum(len(rows) for rows in group_rows[:chart_groups]), "", "", main])
+    if saving:
+        steps.append(["Save", total, "", "", main])
+    return plan_table(xtIntl, steps, xtIntl.loadstring("panel_plan_summary").format(
+        len(tasks), workers, chart_groups))
+
+
+def create_panel_group_output(charts, group_id, group_result, time_data, spans, hp_footnote=None, hamilton=()):
+    # Reuses the single series charts with the group id appended to every variable name; spans
+    # holds the (start, values, mask) of each variable within the group's rows
+    def label(var):
+        return f"{var} ({group_id})"
+
+    chart_result = {filter_name: {label(var): var_result for var, var_result in filter_result.items()}
+                    for filter_name, filter_result in group_result.items()}
+
+    def var_time(var):
+        return span_time(time_data, spans[var][0], len(spans[var][1]))
+
+    for var in group_result.get("hp_filter", {}):
+        create_hp_filter_output(charts, chart_result, var_time(var), spans[var][1], label(var), hp_footnote)
+    for var in group_result.get("hamilton_filter", {}):
+        create_hamilton_filter_output(charts, chart_result, var_time(var), spans[var][1], label(var), *hamilton)
+
+    bk_cf_vars = list(group_result.get("bk_filter", group_result.get("cf_filter", {})))
+    for (start, length), group_vars in group_by_span(bk_cf_vars, spans).items():
+        group_time = span_time(time_data, start, length)
+        suffix = group_id if length == len(time_data) else f"{group_id}, {start + 1}-{start + length}"
+        create_bk_cf_series_output(charts, {label(var): spans[var][1] for var in group_vars}, group_time,
+                                   dataset_id=f"bk_cf_series_data ({suffix})")
+        if "bk_filter" in group_result:
+            create_bk_filter_output(charts, chart_result, group_time, [label(var) for var in group_vars],
+                                    dataset_id=f"bk_filter_data ({suffix})")
+        if "cf_filter" in group_result:
+            create_cf_filter_output(charts, chart_result, group_time, [label(var) for var in group_vars],
+                                    dataset_id=f"cf_filter_data ({suffix})")
+
+
+def lttb_indices(y, max_points):
+    # Largest-Triangle-Three-Buckets: keeps the first and last point and, from each of
+    # max_points - 2 equal buckets, the point spanning the largest triangle with the
+    # previously kept point and the average of the next bucket.
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if max_points <= 0 or n <= max_points or max_points < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    sums = np.r_[0.0, np.cumsum(y)]
+    counts = edges[1:] - edges[:-1]
+    average_y = np.r_[(sums[edges[1:]] - sums[edges[:-1]]) / counts, y[-1]]
+    average_x = np.r_[(edges[:-1] + edges[1:] - 1) / 2.0, n - 1]
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_x, next_y = average_x[i + 1], average_y[i + 1]
+        x = np.arange(start, end)
+        area = np.abs((a - next_x) * (y[start:end] - y[a]) - (a - x) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+class ChartDataset:
+    """Columns that share one time axis; each column is decimated and converted once for all its charts"""
+
+    def __init__(self, dataset_id, time_data, axis_label=None):
+        # With an axis label the x values are numbers on a linear scale instead of date categories
+        self.dataset_id = dataset_id
+        self.time_data = time_data
+        self.axis_label = axis_label
+        self.columns = {}
+        self.lines = None
+        self.shown = 0
+        self.total = 0
+
+    def add_column(self, key, values):
+        # Each distinct column is registered once and gets a GPL safe name
+        if key not in self.columns:
+            self.columns[key] = (f"y{len(self.columns)}", np.asarray(values, dtype=np.float64))
+        return self.columns[key][0]
+
+    def render(self, max_points, float32=False):
+        # Every column keeps its own LTTB selection of up to max_points points
+        if self.lines is not None:
+            return
+        self.total = min(len(values) for _, values in self.columns.values())
+        self.lines = {}
+        for name, values in self.columns.values():
+            indices = lttb_indices(values[:self.total], max_points)
+            if float32:
+                # Shortest float32 text, so the chart data carries about 7 significant digits
+                points = [float(text) for text in values[indices].astype(np.float32).astype(str)]
+            else:
+                points = values[indices].tolist()
+            self.lines[name] = (indices, points)
+        self.shown = max(len(indices) for indices, _ in self.lines.values())
+
+    def points(self, names):
+        # (x, y, line) lists of the given lines in time order, so sort.data() meets the x
+        # categories chronologically even though each line was decimated on its own
+        indices = np.concatenate([self.lines[name][0] for name in names])
+        values = [value for name in names for value in self.lines[name][1]]
+        line = [i for i, name in enumerate(names) for _ in self.lines[name][0]]
+        order = np.argsort(indices, kind="stable")
+        return ([self.time_data[i] for i in indices[order]], [values[i] for i in order],
+                [line[i] for i in order])
+
+
+class ChartBuilder:
+    """Chart rendering stage: charts are queued and rendered from their shared datasets"""
+
+    def __init__(self, xtIntl, output_json, max_points, float32=False, small_multiples=False):
+        self.xtIntl = xtIntl
+        self.output_json = output_json
+        self.max_points = max_points
+        self.float32 = float32
+        self.small_multiples = small_multiples
+        self.datasets = {}
+        self.charts = []
+        self.mapped = set()
+
+    def dataset(self, dataset_id, time_data, axis_label=None):
+        dataset = self.datasets.get(dataset_id)
+        if dataset is None:
+            dataset = self.datasets[dataset_id] = ChartDataset(dataset_id, time_data, axis_label)
+        return dataset
+
+    def add_line_chart(self, title, dataset, lines, y_label, subfootnote=None):
+        # lines holds (column name, legend label) pairs; legends are only drawn for several lines
+        self.charts.append((self.create_line_chart, title, dataset, lines, y_label, subfootnote))
+
+    def add_small_multiples_chart(self, title, dataset, lines, y_label, subfootnote=None):
+        # One panel per line, stacked on a shared time axis and value scale
+        self.charts.append((self.create_small_multiples_chart, title, dataset, lines, y_label, subfootnote))
+
+    @profiled("Charts")
+    def finish(self):
+        for create_chart, title, dataset, lines, y_label, subfootnote in self.charts:
+            dataset.render(self.max_points, self.float32)
+            self.output_json.add_chart(create_chart(title, dataset, lines, y_label, subfootnote))
+        self.charts = []
+
+    def add_variable_mappings(self, gpl_chart, graph_dataset, create_mappings):
+        # The columns of a dataset id are mapped with the first chart that reads them; later
+        # charts on the same id refer to them through their SOURCE statement
+        if graph_dataset in self.mapped:
+            return
+        self.mapped.add(graph_dataset)
+        for name, values in create_mappings():
+            gpl_chart.add_variable_mapping(name, values, graph_dataset)
+
+    def add_text_guides(self, gpl_statements, title, dataset, subfootnote):
+        gpl_statements.append("GUIDE: text.title(label(\"{0}\"))".format(title))
+        if subfootnote:
+            gpl_statements.append("GUIDE: text.subfootnote(label(\"{0}\"))".format(subfootnote))
+        if dataset.shown < dataset.total:
+            footnote = self.xtIntl.loadstring("decimation_footnote").format(
+                dataset.shown, dataset.total, dataset.total / dataset.shown)
+            gpl_statements.append("GUIDE: text.footnote(label(\"{0}\"))".format(footnote))
+
+    def create_line_chart(self, title, dataset, lines, y_label, subfootnote):
+        # Undecimated columns share the x values, so every chart of the dataset reads one source with
+        # all its columns. Decimated lines bring their own x values: a single line is mapped with
+        # them, several lines are stacked into x, y and a series label in time order.
+        names = [name for name, _ in lines]
+        shared = dataset.shown == dataset.total
+        long_format = not shared and len(lines) > 1
+        graph_dataset = dataset.dataset_id if shared else f"{dataset.dataset_id} {'_'.join(names)}"
+        x_label = dataset.axis_label or self.xtIntl.loadstring("date_label")
+        legend = len(lines) > 1
+
+        gpl_statements = [
+            "SOURCE: s = userSource(id(\"{0}\"))".format(graph_dataset),
+            "DATA: x = col(source(s), name(\"x\"))" if dataset.axis_label else
+            "DATA: x = col(source(s), name(\"x\"), unit.category())",
+        ]
+        if long_format:
+            gpl_statements.extend(["DATA: y = col(source(s), name(\"y\"))",
+                                   "DATA: series = col(source(s), name(\"series\"), unit.category())"])
+        else:
+            gpl_statements.extend("DATA: {0} = col(source(s), name(\"{0}\"))".format(name) for name in names)
+        gpl_statements.extend([
+            "GUIDE: axis(dim(1), label(\"{0}\"))".format(x_label),
+            "GUIDE: axis(dim(2), label(\"{0}\"))".format(y_label),
+        ])
+        if legend:
+            gpl_statements.append("GUIDE: legend(aesthetic(aesthetic.color.interior))")
+        self.add_text_guides(gpl_statements, title, dataset, subfootnote)
+        gpl_statements.extend([
+            "SCALE: linear(dim(1))" if dataset.axis_label else "SCALE: cat(dim(1), sort.data())",
+            "SCALE: linear(dim(2))",
+        ])
+        if long_format:
+            gpl_statements.extend([
+                "SCALE: cat(aesthetic(aesthetic.color.interior))",
+                "ELEMENT: line(position(x*y), color.interior(series), size(size.\"1pt\"))",
+            ])
+        elif legend:
+            gpl_statements.append("SCALE: cat(aesthetic(aesthetic.color.interior))")
+            gpl_statements.extend(
+                "ELEMENT: line(position(x*{0}), color.interior(\"{1}\"), size(size.\"1pt\"))".format(name, label)
+                for name, label in lines)
+        else:
+            gpl_statements.append("ELEMENT: line(position(x*{0}),size(size.\"1pt\"))".format(names[0]))
+
+        def create_mappings():
+            if shared:
+                names_shown = [name for name, _ in dataset.columns.values()]
+                x, _, _ = dataset.points(names_shown[:1])
+                return [("x", x)] + [(name, dataset.lines[name][1]) for name in names_shown]
+            x, y, line = dataset.points(names)
+            if long_format:
+                return [("x", x), ("y", y), ("series", [lines[i][1] for i in line])]
+            return [("x", x), (names[0], y)]
+
+        gpl_chart = GplChart(title)
+        gpl_chart.add_gpl_statement(gpl_statements)
+        self.add_variable_mappings(gpl_chart, graph_dataset, create_mappings)
+        return gpl_chart
+
+    def create_small_multiples_chart(self, title, dataset, lines, y_label, subfootnote):
+        # Panels need the lines in long format: x, value and a series label for each point
+        names = [name for name, _ in lines]
+        graph_dataset = f"{dataset.dataset_id} panels {'_'.join(names)}"
+        x_label = self.xtIntl.loadstring("date_label")
+
+        gpl_statements = [
+            "SOURCE: s = userSource(id(\"{0}\"))".format(graph_dataset),
+            "DATA: x = col(source(s), name(\"x\"), unit.category())",
+            "DATA: value = col(source(s), name(\"value\"))",
+            "DATA: series = col(source(s), name(\"series\"), unit.category())",
+            "GUIDE: axis(dim(1), label(\"{0}\"))".format(x_label),
+            "GUIDE: axis(dim(2), label(\"{0}\"))".format(y_label),
+            "GUIDE: axis(dim(4), label(\"{0}\"))".format(self.xtIntl.loadstring("variable_label")),
+        ]
+        self.add_text_guides(gpl_statements, title, dataset, subfootnote)
+        gpl_statements.extend([
+            "SCALE: cat(dim(1), sort.data())",
+            "SCALE: linear(dim(2))",
+            "SCALE: cat(dim(4), sort.data())",
+            "ELEMENT: line(position(x*value*1*series), size(size.\"1pt\"))",
+        ])
+
+        def create_mappings():
+            x, value, line = dataset.points(names)
+            return [("x", x), ("value", value), ("series", [lines[i][1] for i in line])]
+
+        gpl_chart = GplChart(title)
+        gpl_chart.add_gpl_statement(gpl_statements)
+        self.add_variable_mappings(gpl_chart, graph_dataset, create_mappings)
+        return gpl_chart
+
+
+@profiled("Charts")
+def create_hp_filter_output(charts, result, time_data, hp_data, hp_variable, footnote=None):
+    xtIntl = charts.xtIntl
+    hp_filter_results = result["hp_filter"][hp_variable]
+
+    # The variable, its trend and its cycle share one dataset
+    dataset = charts.dataset(f"{hp_variable}_series_data", time_data)
+    series = dataset.add_column(hp_variable, hp_data)
+    trend = dataset.add_column(f"{hp_variable} hp_trend", hp_filter_results["trend"])
+    cycle = dataset.add_column(f"{hp_variable} hp_cycle", hp_filter_results["cycle"])
 
-    hp_filter_trend_chart.add_gpl_statement(gpl_statements)
-    hp_filter_trend_chart.add_variable_mapping("x", trend_x_data, graph_dataset)
-    hp_filter_trend_chart.add_variable_mapping("y", trend, graph_dataset)
+    # HP variable vs Time Data Plot
+    chart_title = xtIntl.loadstring("hp_variable_chart_title") + f" {hp_variable}"
+    charts.add_line_chart(chart_title, dataset, [(series, hp_variable)], hp_variable)
 
-    output_json.add_chart(hp_filter_trend_chart)
+    #HP Filter Trends vs Time plot
+    title = xtIntl.loadstring("hp_filter_trend_title")
+    charts.add_line_chart(f"{title} {hp_variable}", dataset, [(trend, "Trend")],
+                          xtIntl.loadstring("trend_label"), subfootnote=footnote)
 
     #HP Filter Cycle vs Time plot
-    cycle_title = xtIntl.loadstring("hp_filter_cycle_title")
-    cycle_x_label = xtIntl.loadstring("date_label")
-    cycle_x_data = list(time_data)
-    cycle_y_label = xtIntl.loadstring("cycle_label")
-
-    graph_dataset = "hp_filter_cycle_data"
-
-    hp_filter_cycle_chart = GplChart(cycle_title)
-
-    gpl_statements = [
-        "SOURCE: s = userSource(id(\"{0}\"))".format(graph_dataset),
-        "DATA: x = col(source(s), name(\"x\"), unit.category())",
-        "DATA: y = col(source(s), name(\"y\"))",
-        "GUIDE: axis(dim(1), label(\"{0}\"))".format(cycle_x_label),
-        "GUIDE: axis(dim(2), label(\"{0}\"))".format(cycle_y_label),
-        "GUIDE: text.title(label(\"{0}\"))".format(cycle_title),
-        "SCALE: cat(dim(1), sort.data())",
-        "SCALE: linear(dim(2))",
-        "ELEMENT: line(position(x*y),size(size.\"1pt\"))",
-    ]
-
-    hp_filter_cycle_chart.add_gpl_statement(gpl_statements)
-    hp_filter_cycle_chart.add_variable_mapping("x", cycle_x_data, graph_dataset)
-    hp_filter_cycle_chart.add_variable_mapping("y", cycle, graph_dataset)
-
-    output_json.add_chart(hp_filter_cycle_chart)
+    title = xtIntl.loadstring("hp_filter_cycle_title")
+    charts.add_line_chart(f"{title} {hp_variable}", dataset, [(cycle, "Cycle")],
+                          xtIntl.loadstring("cycle_label"), subfootnote=footnote)
 
     #HP Filter Trend and Variable combine Plot
     title = xtIntl.loadstring("hp_filter_trend_and_variable_plot")
-    hpvar_trend_chart_title = f"{title} {hp_variable}"
-    hpvar_trend_x_label = xtIntl.loadstring("date_label")
-    hpvar_trend_y_label = xtIntl.loadstring("combined_y_data_label")
-    subfootnote = f"Source: {hp_variable}"
-
-
-    x_data = list(time_data)
-    hpvar_trend_x_data = x_data * 2  
-    hpvar_trend_y_data = trend + hp_data
-
-    color_data = (["Trend"] * len(time_data)) + ([hp_variable] * len(time_data))
-
-    graph_dataset = "hp_filter_combined_graph_data"
-
-    gpl_chart = GplChart(hpvar_trend_chart_title)
-
-    gpl_statements = [
-        "SOURCE: s=userSource(id(\"{0}\"))".format(graph_dataset),
-        "DATA: x=col(source(s), name(\"x\"), unit.category())",
-        "DATA: y=col(source(s), name(\"y\"))",
-        "DATA: color=col(source(s), name(\"color\"), unit.category())",
-        "GUIDE: axis(dim(1), label(\"{0}\"))".format(hpvar_trend_x_label),
-        "GUIDE: axis(dim(2), label(\"{0}\"))".format(hpvar_trend_y_label),
-        "GUIDE: legend(aesthetic(aesthetic.color.interior))",
-        "GUIDE: text.title(label(\"{0}\"))".format(hpvar_trend_chart_title),
-        "GUIDE: text.subfootnote(label(\"{0}\"))".format(subfootnote),
-        "SCALE: cat(dim(1), sort.data())",
-        "SCALE: linear(dim(2))",
-        "SCALE: cat(aesthetic(aesthetic.color.interior))",
-        "ELEMENT: line(position(x*y), color.interior(color), size(size.\"1pt\"))",
-       #"ELEMENT: point(position(x*y), color.interior(color), size(size.\"3pt\"))"
-    ]
-
-    gpl_chart.add_gpl_statement(gpl_statements)
+    charts.add_line_chart(f"{title} {hp_variable}", dataset, [(trend, "Trend"), (series, hp_variable)],
+                          xtIntl.loadstring("combined_y_data_label"), subfootnote=f"Source: {hp_variable}")
+
+
+def add_variable_charts(charts, dataset, columns, title, combined_title):
+    # One chart per variable, or a single small-multiples chart, plus an overlay of all variables
+    xtIntl = charts.xtIntl
+    names = list(columns)
+    lines = [(columns[var], var) for var in names]
+    if charts.small_multiples and len(names) > 1:
+        charts.add_small_multiples_chart(f"{title} {' & '.join(names)}", dataset, lines,
+                                         xtIntl.loadstring("combined_y_data_label"))
+    else:
+        for column, var in lines:
+            charts.add_line_chart(f"{title} {var}", dataset, [(column, var)], var)
 
+    if combined_title is None or len(names) < 2:
+        return
+    charts.add_line_chart(f"{combined_title} {' & '.join(names)}", dataset, lines,
+                          xtIntl.loadstring("combined_y_data_label"),
+                          subfootnote=f"Source: {', '.join(names[:-1])} and {names[-1]}")
 
-    gpl_chart.add_variable_mapping("x", hpvar_trend_x_data, graph_dataset)
-    gpl_chart.add_variable_mapping("y", hpvar_trend_y_data, graph_dataset)
-    gpl_chart.add_variable_mapping("color", color_data, graph_dataset)
 
+@profiled("Charts")
+def create_hamilton_filter_output(charts, result, time_data, ham_data, ham_variable, h, p):
+    xtIntl = charts.xtIntl
+    ham_results = result["hamilton_filter"][ham_variable]
 
-    output_json.add_chart(gpl_chart)
+    # The fitted values start h + p - 1 periods into the series, so these charts get their own axis
+    shift = h + p - 1
+    dataset = charts.dataset(f"{ham_variable}_hamilton_data", time_data[shift:])
+    series = dataset.add_column(ham_variable, ham_data[shift:])
+    trend = dataset.add_column(f"{ham_variable} hamilton_trend", ham_results["trend"])
+    cycle = dataset.add_column(f"{ham_variable} hamilton_cycle", ham_results["cycle"])
+    footnote = xtIntl.loadstring("hamilton_footnote").format(h, p - 1, shift)
 
+    #Hamilton Filter Trend and Variable combine Plot
+    title = xtIntl.loadstring("hamilton_trend_title")
+    charts.add_line_chart(f"{title} {ham_variable}", dataset, [(trend, "Trend"), (series, ham_variable)],
+                          xtIntl.loadstring("combined_y_data_label"), subfootnote=footnote)
 
-def create_bk_filter_output(xtIntl, result, time_data, bk_filter_data, fields, output_json, bk_cf_names):
+    #Hamilton Filter Cycle vs Time plot, next to the HP cycle when the variable was also HP filtered
+    lines = [(cycle, "Hamilton")]
+    hp_results = result.get("hp_filter", {}).get(ham_variable)
+    if hp_results is not None:
+        lines.append((dataset.add_column(f"{ham_variable} hp_cycle", hp_results["cycle"][shift:]), "HP"))
+    title = xtIntl.loadstring("hamilton_cycle_title")
+    charts.add_line_chart(f"{title} {ham_variable}", dataset, lines, xtIntl.loadstring("cycle_label"),
+                          subfootnote=footnote)
 
-    size_of_bk_cf_field = len(bk_cf_names)
-    var1 = bk_cf_names[0]
 
-    #BK variable-1 vs Time Data Plot
+@profiled("Charts")
+def create_bk_filter_output(charts, result, time_data, bk_cf_names, dataset_id="bk_filter_data"):
+    # BK cycles are centered and lose K observations at each end of the time axis
+    cycle_length = len(result["bk_filter"][bk_cf_names[0]])
+    offset = max((len(time_data) - cycle_length) // 2, 0)
+    dataset = charts.dataset(dataset_id, time_data[offset:offset + cycle_length])
 
-    title = xtIntl.loadstring("bk_filter_plot_title")
-    var1_chart_title = title + f" {var1}"
-    var1_bk_x_label = xtIntl.loadstring("date_label")
-    var1_bk_x_data = list(time_data)
-    var1_bk_y_label = var1
-    var1_bk_y_data = result["bk_filter"][var1]
+    columns = {var: dataset.add_column(f"{var} bk_cycle", result["bk_filter"][var]) for var in bk_cf_names}
+    add_variable_charts(charts, dataset, columns, charts.xtIntl.loadstring("bk_filter_plot_title"),
+                        charts.xtIntl.loadstring("bk_filter_plot_combined_title"))
 
-    graph_dataset = f"bk_filter_graph_{var1}_data"
 
-    var1_bk_chart = GplChart(var1_chart_title)
+@profiled("Charts")
+def create_cf_filter_output(charts, result, time_data, bk_cf_names, dataset_id="cf_filter_data"):
+    dataset = charts.dataset(dataset_id, time_data)
 
-    gpl_statements = [
-        "SOURCE: s = userSource(id(\"{0}\"))".format(graph_dataset),
-        "DATA: x = col(source(s), name(\"x\"), unit.category())",
-        "DATA: y = col(source(s), name(\"y\"))",
-        "GUIDE: axis(dim(1), label(\"{0}\"))".format(var1_bk_x_label),
-        "GUIDE: axis(dim(2), label(\"{0}\"))".format(var1_bk_y_label),
-        "GUIDE: text.title(label(\"{0}\"))".format(var1_chart_title),
-        "SCALE: cat(dim(1), sort.data())",
-        "SCALE: linear(dim(2))",
-        "ELEMENT: line(position(x*y),size(size.\"1pt\"))",
-    ]
+    columns = {var: dataset.add_column(f"{var} cf_cycle", result["cf_filter"][var]["cycle"])
+               for var in bk_cf_names}
+    add_variable_charts(charts, dataset, columns, charts.xtIntl.loadstring("cf_filter_plot_title"),
+                        charts.xtIntl.loadstring("cf_filter_comparison_plot_title"))
 
-    var1_bk_chart.add_gpl_statement(gpl_statements)
-    var1_bk_chart.add_variable_mapping("x", var1_bk_x_data, graph_dataset)
-    var1_bk_chart.add_variable_mapping("y", var1_bk_y_data, graph_dataset)
 
-    output_json.add_chart(var1_bk_chart)
-
-    if size_of_bk_cf_field < 2:
-        return
-    
-    var2 = bk_cf_names[1]
-    
-    #BK variable-2 vs Time Data Plot
-    var2_chart_title = title + f" {var2}"
-    var2_bk_x_label = xtIntl.loadstring("date_label")
-    var2_bk_x_data = list(time_data)
-    var2_bk_y_label = var2
-    var2_bk_y_data = result["bk_filter"][var2]
-
-    graph_dataset = f"bk_filter_graph_{var2}_data"
-
-    var2_bk_chart = GplChart(var2_chart_title)  
-
-    gpl_statements = [
-        "SOURCE: s = userSource(id(\"{0}\"))".format(graph_dataset),
-        "DATA: x = col(source(s), name(\"x\"), unit.category())",
-        "DATA: y = col(source(s), name(\"y\"))",
-        "GUIDE: axis(dim(1), label(\"{0}\"))".format(var2_bk_x_label),
-        "GUIDE: axis(dim(2), label(\"{0}\"))".format(var2_bk_y_label),
-        "GUIDE: text.title(label(\"{0}\"))".format(var2_chart_title),
-        "SCALE: cat(dim(1), sort.data())",
-        "SCALE: linear(dim(2))",
-        "ELEMENT: line(position(x*y),size(size.\"1pt\"))",
-    ]
-
-    var2_bk_chart.add_gpl_statement(gpl_statements)
-    var2_bk_chart.add_variable_mapping("x", var2_bk_x_data, graph_dataset)
-    var2_bk_chart.add_variable_mapping("y", var2_bk_y_data, graph_dataset)
-  
-    output_json.add_chart(var2_bk_chart)
-
-    #BK Filter combined Plot for Variable 1 and Variable 2
-    title_combined = xtIntl.loadstring("bk_filter_plot_combined_title")
-    combined_chart_title = f"{title_combined} {var1} & {var2}"
-    combined_x_label = xtIntl.loadstring("date_label")
-    combined_y_label = xtIntl.loadstring("combined_y_data_label")
-    combined_subfootnote = f"Source: {var1} and {var2}"
-    
-    minimum_length = min(len(time_data), len(var1_bk_y_data), len(var2_bk_y_data))
-
-    time_data = time_data[:minimum_length]
-    var1_bk_y_data = var1_bk_y_data[:minimum_length]
-    var2_bk_y_data = var2_bk_y_data[:minimum_length]
-
-    combined_x_data = list(time_data) * 2
-    combined_y_data = var1_bk_y_data + var2_bk_y_data
-    combined_color_data = [var1] * len(time_data) + [var2] * len(time_data)
-    
- 
-    graph_dataset = "bk_filter_graph_data"
-    
-    gpl_chart = GplChart(combined_chart_title)
-    
-    gpl_statements = [
-        "SOURCE: s=userSource(id(\"{0}\"))".format(graph_dataset),
-        "DATA: x=col(source(s), name(\"x\"), unit.category())",
-        "DATA: y=col(source(s), name(\"y\"))",
-        "DATA: color=col(source(s), name(\"color\"), unit.category())",
-        "GUIDE: axis(dim(1), label(\"{0}\"))".format(combined_x_label),
-        "GUIDE: axis(dim(2), label(\"{0}\"))".format(combined_y_label),
-        "GUIDE: legend(aesthetic(aesthetic.color.interior))",
-        "GUIDE: text.title(label(\"{0}\"))".format(combined_chart_title),
-        "GUIDE: text.subfootnote(label(\"{0}\"))".format(combined_subfootnote),
-        "SCALE: cat(dim(1), sort.data())",
-        "SCALE: linear(dim(2))",
-        "SCALE: cat(aesthetic(aesthetic.color.interior))",
-        "ELEMENT: line(position(x*y), color.interior(color), size(size.\"1pt\"))",
-       #"ELEMENT: point(position(x*y), color.interior(color), size(size.\"3pt\"))"
-    ]
-    
-    gpl_chart.add_gpl_statement(gpl_statements)
-    
-    gpl_chart.add_variable_mapping("x", combined_x_data, graph_dataset)
-    gpl_chart.add_variable_mapping("y", combined_y_data, graph_dataset)
-    gpl_chart.add_variable_mapping("color", combined_color_data, graph_dataset)
-    
-    output_json.add_chart(gpl_chart)
-
-
-def create_cf_filter_output(xtIntl, result, time_data, fields, output_json, bk_cf_names):
-
-    size_of_bk_cf_field = len(bk_cf_names)
-
-    var1 = bk_cf_names[0]
-
-    var1_cycle_data = result["cf_filter"][var1]["cycle"]
-
-    title_var1 = xtIntl.loadstring("cf_filter_plot_title")
-    var1_cycle_chart_title = f"{title_var1} {var1}"
-    var1_cycle_cf_x_label = xtIntl.loadstring("date_label")
-    var1_cycle_cf_x_data = list(time_data)
-    var1_cycle_cf_y_label = var1
-    var1_cycle_cf_y_data = var1_cycle_data
-
-    graph_dataset = f"cf_filter_graph_{var1}_data"
-
-    var1_cf_chart = GplChart(var1_cycle_chart_title)
-    gpl_statements = [
-        "SOURCE: s = userSource(id(\"{0}\"))".format(graph_dataset),
-        "DATA: x = col(source(s), name(\"x\"), unit.category())",
-        "DATA: y = col(source(s), name(\"y\"))",
-        "GUIDE: axis(dim(1), label(\"{0}\"))".format(var1_cycle_cf_x_label),
-        "GUIDE: axis(dim(2), label(\"{0}\"))".format(var1_cycle_cf_y_label),
-        "GUIDE: text.title(label(\"{0}\"))".format(var1_cycle_chart_title),
-        "SCALE: cat(dim(1), sort.data())",
-        "SCALE: linear(dim(2))",
-        "ELEMENT: line(position(x*y),size(size.\"1pt\"))",
-    ]
-    var1_cf_chart.add_gpl_statement(gpl_statements)
-    var1_cf_chart.add_variable_mapping("x", var1_cycle_cf_x_data, graph_dataset)
-    var1_cf_chart.add_variable_mapping("y", var1_cycle_cf_y_data, graph_dataset)
-
-    output_json.add_chart(var1_cf_chart)
-
-    if size_of_bk_cf_field  < 2:
-        return
-    
-    var2 = bk_cf_names[1]
-
-    var2_cycle_data = result["cf_filter"][var2]["cycle"]
-
-
-    title_var2 = xtIntl.loadstring("cf_filter_plot_title")
-    var2_cycle_chart_title = f"{title_var2} {var2}"
-    var2_cycle_cf_x_label = xtIntl.loadstring("date_label")
-    var2_cycle_cf_x_data = list(time_data)
-    var2_cycle_cf_y_label = var2
-    var2_cycle_cf_y_data = var2_cycle_data
-
-    graph_dataset = f"cf_filter_graph_{var2}_data"
-
-    var2_cf_chart = GplChart(var2_cycle_chart_title)
-
-    gpl_statements = [
-        "SOURCE: s = userSource(id(\"{0}\"))".format(graph_dataset),
-        "DATA: x = col(source(s), name(\"x\"), unit.category())",
-        "DATA: y = col(source(s), name(\"y\"))",
-        "GUIDE: axis(dim(1), label(\"{0}\"))".format(var2_cycle_cf_x_label),
-        "GUIDE: axis(dim(2), label(\"{0}\"))".format(var2_cycle_cf_y_label),
-        "GUIDE: text.title(label(\"{0}\"))".format(var2_cycle_chart_title),
-        "SCALE: cat(dim(1), sort.data())",
-        "SCALE: linear(dim(2))",
-        "ELEMENT: line(position(x*y),size(size.\"1pt\"))",
-    ]
-
-    var2_cf_chart.add_gpl_statement(gpl_statements)
-    var2_cf_chart.add_variable_mapping("x", var2_cycle_cf_x_data, graph_dataset)
-    var2_cf_chart.add_variable_mapping("y", var2_cycle_cf_y_data, graph_dataset)
-
-    output_json.add_chart(var2_cf_chart)
-
-    combined_chart_title = xtIntl.loadstring("cf_filter_comparison_plot_title") + f" {var1} & {var2}"
-    combined_x_label = xtIntl.loadstring("date_label")
-    combined_y_label = xtIntl.loadstring("combined_y_data_label")
-    combined_subfootnote = f"Source: {var1} and {var2}"
-    combined_x_data = list(time_data) * 2
-    combined_y_data = var1_cycle_data + var2_cycle_data
-    combined_color_data = [var1] * len(time_data) + [var2] * len(time_data)
-
-    graph_dataset = "cf_filter_graph_data"
-    gpl_chart = GplChart(combined_chart_title)
-    gpl_statements = [
-        "SOURCE: s=userSource(id(\"{0}\"))".format(graph_dataset),
-        "DATA: x=col(source(s), name(\"x\"), unit.category())",
-        "DATA: y=col(source(s), name(\"y\"))",
-        "DATA: color=col(source(s), name(\"color\"), unit.category())",
-        "GUIDE: axis(dim(1), label(\"{0}\"))".format(combined_x_label),
-        "GUIDE: axis(dim(2), label(\"{0}\"))".format(combined_y_label),
-        "GUIDE: legend(aesthetic(aesthetic.color.interior))",
-        "GUIDE: text.title(label(\"{0}\"))".format(combined_chart_title),
-        "GUIDE: text.subfootnote(label(\"{0}\"))".format(combined_subfootnote),
-        "SCALE: cat(dim(1), sort.data())",
-        "SCALE: linear(dim(2))",
-        "SCALE: cat(aesthetic(aesthetic.color.interior))",
-        "ELEMENT: line(position(x*y), color.interior(color), size(size.\"1pt\"))",
-       #"ELEMENT: point(position(x*y), color.interior(color), size(size.\"3pt\"))"
-    ]
-    gpl_chart.add_gpl_statement(gpl_statements)
-    gpl_chart.add_variable_mapping("x", combined_x_data, graph_dataset)
-    gpl_chart.add_variable_mapping("y", combined_y_data, graph_dataset)
-    gpl_chart.add_variable_mapping("color", combined_color_data, graph_dataset)
-
-    output_json.add_chart(gpl_chart)
-
-def create_bk_cf_variable_time_series_plot(xtIntl, var_data, time_data, var, fields, output_json):
+@profiled("Charts")
+def create_bk_cf_variable_time_series_plot(charts, var_data, time_data, var):
 
     #BK and CF variable vs Time Data Plot
-    chart_title = xtIntl.loadstring("hp_variable_chart_title") + f" {var}"
-    chart_x_label = xtIntl.loadstring("date_label")
-    chart_x_data = list(time_data)
-    chart_y_label = var
-    chart_y_data = var_data
-
-    graph_dataset = f"bk_cf_graph_{var}_data"
-
-    time_series_chart = GplChart(chart_title)
-
-    gpl_statements = [
-        "SOURCE: s = userSource(id(\"{0}\"))".format(graph_dataset),
-        "DATA: x = col(source(s), name(\"x\"), unit.category())",
-        "DATA: y = col(source(s), name(\"y\"))",
-        "GUIDE: axis(dim(1), label(\"{0}\"))".format(chart_x_label),
-        "GUIDE: axis(dim(2), label(\"{0}\"))".format(chart_y_label),
-        "GUIDE: text.title(label(\"{0}\"))".format(chart_title),
-        "SCALE: cat(dim(1), sort.data())",
-        "SCALE: linear(dim(2))",
-        "ELEMENT: line(position(x*y),size(size.\"1pt\"))",
-    ]
-
-    time_series_chart.add_gpl_statement(gpl_statements)
-    time_series_chart.add_variable_mapping("x", chart_x_data, graph_dataset)
-    time_series_chart.add_variable_mapping("y", chart_y_data, graph_dataset)
-
-    output_json.add_chart(time_series_chart)
+    dataset = charts.dataset(f"{var}_series_data", time_data)
+    series = dataset.add_column(var, var_data)
+    chart_title = charts.xtIntl.loadstring("hp_variable_chart_title") + f" {var}"
+    charts.add_line_chart(chart_title, dataset, [(series, var)], var)
+
+
+@profiled("Charts")
+def create_bk_cf_series_output(charts, series, time_data, dataset_id="bk_cf_series_data"):
+    # series maps each variable to its values; the small-multiples chart puts them in one dataset
+    if not charts.small_multiples or len(series) < 2:
+        for var, values in series.items():
+            create_bk_cf_variable_time_series_plot(charts, values, time_data, var)
+        return
+    dataset = charts.dataset(dataset_id, time_data)
+    columns = {var: dataset.add_column(var, values) for var, values in series.items()}
+    add_variable_charts(charts, dataset, columns, charts.xtIntl.loadstring("hp_variable_chart_title"), None)
+
+
+# Date axis for the DATE_ factor levels. The patterns are compiled once, the format is
+# picked from the first level and every level is matched a single time. Levels become
+# integer period ordinals that are ordered with one argsort; the sorted labels are only
+# built when a chart asks for them.
+DATE_FACTOR_PATTERN = re.compile(r'DATE_=(.+?)\]')
+WEEKDAYS = "SUN|MON|TUE|WED|THU|FRI|SAT"
+# Tried in this order: weekday levels such as "MON 1200" also match the month pattern
+DATE_FORMAT_PATTERNS = {
+    "weekday_first": re.compile(rf'({WEEKDAYS}) (\d+)'),
+    "number_first": re.compile(rf'(\d+) ({WEEKDAYS})'),
+    "quarter": re.compile(r'Q([1-4]) (\d{4})'),
+    "month": re.compile(r'([A-Z]{3}) (\d{4})'),
+}
+WEEKDAY_ORDER = {'SUN': 0, 'MON': 1, 'TUE': 2, 'WED': 3, 'THU': 4, 'FRI': 5, 'SAT': 6}
+MONTH_ORDER = {'JAN': 1, 'FEB': 2, 'MAR': 3, 'APR': 4, 'MAY': 5, 'JUN': 6,
+               'JUL': 7, 'AUG': 8, 'SEP': 9, 'OCT': 10, 'NOV': 11, 'DEC': 12}
+
+
+class DateAxis:
+    """Sorted date factor levels as an int64 period index with lazily built labels"""
+
+    def __init__(self, levels, ordinals=None):
+        self.levels = levels
+        if ordinals is None:
+            self.order = np.arange(len(levels))
+            self.ordinals = self.order.copy()
+        else:
+            self.order = np.argsort(ordinals, kind="stable")
+            self.ordinals = ordinals[self.order]
+        self._labels = None
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            self._labels = [self.levels[i] for i in self.order]
+        return self._labels
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.levels[i] for i in self.order[index]]
+        return self.levels[self.order[index]]
+
+    def __iter__(self):
+        return iter(self.labels)
+
+
+def detect_date_format(cleaned_dates):
+    # The first format that all levels match, with their ordinals; (None, None) when there is none
+    for name, pattern in DATE_FORMAT_PATTERNS.items():
+        if pattern.fullmatch(cleaned_dates[0]):
+            ordinals = date_ordinals(name, cleaned_dates)
+            if ordinals is not None:
+                return name, ordinals
+    return None, None
+
+
+def date_ordinals(date_format, cleaned_dates):
+    pattern = DATE_FORMAT_PATTERNS[date_format]
+    matches = [pattern.fullmatch(d) for d in cleaned_dates]
+    if not all(matches):
+        return None
+    first = [m.group(1) for m in matches]
+    second = [m.group(2) for m in matches]
+
+    if date_format == "quarter":
+        return np.array(second, dtype=np.int64) * 4 + np.array(first, dtype=np.int64) - 1
+    if date_format == "month":
+        if not all(month in MONTH_ORDER for month in first):
+            return None
+        months = np.array([MONTH_ORDER[month] for month in first], dtype=np.int64)
+        return np.array(second, dtype=np.int64) * 12 + months
+    if date_format == "weekday_first":
+        weekdays = np.array([WEEKDAY_ORDER[day] for day in first], dtype=np.int64)
+        numbers = np.array(second, dtype=np.int64)
+        return weekdays * (numbers.max() + 1) + numbers
+    weekdays = np.array([WEEKDAY_ORDER[day] for day in second], dtype=np.int64)
+    return np.array(first, dtype=np.int64) * 7 + weekdays
 
 
 def parse_and_sort_factors(raw_factors):
     cleaned_dates = []
     for factor in raw_factors:
-        match = re.search(r'DATE_=(.+?)\]', factor)
+        match = DATE_FACTOR_PATTERN.search(factor)
         if match:
-            date_str = re.sub(r'\s+', ' ', match.group(1).strip())
-            cleaned_dates.append(date_str)
-
-    def is_quarter_format(date):
-        return re.match(r'^Q[1-4] \d{4}$', date)
-
-    def is_month_format(date):
-        return re.match(r'^[A-Z]{3} \d{4}$', date)
-
-    def is_weekday_format(date):
-        return re.match(
-            r'^(\d+\s+(?:SUN|MON|TUE|WED|THU|FRI|SAT)|'
-            r'(?:SUN|MON|TUE|WED|THU|FRI|SAT)\s+\d+)$', 
-            date
-        )
-
-    weekday_order = {
-        'SUN': 0, 'MON': 1, 'TUE': 2, 'WED': 3,
-        'THU': 4, 'FRI': 5, 'SAT': 6
-    }
-
-    def sort_key(date_str):
-        if is_quarter_format(date_str):
-            quarter, year = date_str.split()
-            return int(year) * 4 + (int(quarter[1]) - 1)
-        elif is_month_format(date_str):
-            dt = datetime.strptime(date_str, "%b %Y")
-            return dt.year * 12 + dt.month
-        else:
-            return float('inf')
-
-    if cleaned_dates:
-        if all(is_weekday_format(d) for d in cleaned_dates):
-            first_part = cleaned_dates[0].split()[0]
-            
-            if first_part in weekday_order:
-                sorted_dates = sorted(
-                    cleaned_dates,
-                    key=lambda x: (
-                        weekday_order[x.split()[0]], 
-                        int(x.split()[1])
-                    )
-                )
-            else:
-                sorted_dates = sorted(
-                    cleaned_dates,
-                    key=lambda x: (
-                        int(x.split()[0]), 
-                        weekday_order[x.split()[1]]
-                    )
-                )
-        elif all(is_quarter_format(d) for d in cleaned_dates) or all(is_month_format(d) for d in cleaned_dates):
-            sorted_dates = sorted(cleaned_dates, key=sort_key)
-        else:
-            sorted_dates = cleaned_dates
-    else:
-        sorted_dates = []
-
-    return sorted_dates
+            cleaned_dates.append(' '.join(match.group(1).split()))
 
+    if not cleaned_dates:
+        return DateAxis([])
 
+    # Levels that do not all share one known format keep their original order
+    _, ordinals = detect_date_format(cleaned_dates)
+    return DateAxis(cleaned_dates, ordinals)
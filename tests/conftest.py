@@ -0,0 +1,26 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The engines only need src/; execute() runs on the host stand-ins in host/
+sys.path[:0] = [os.path.join(ROOT, "host"), os.path.join(ROOT, "src")]
+
+
+def trend_cycle_series(n, k=1, seed=0):
+    # Random walk trend with drift plus a persistent cycle and noise, (n,) or (n, k)
+    rng = np.random.default_rng(seed)
+    trend = np.cumsum(0.05 + 0.2 * rng.standard_normal((n, k)), axis=0)
+    cycle = np.zeros((n, k))
+    shocks = rng.standard_normal((n, k))
+    for t in range(2, n):
+        cycle[t] = 1.6 * cycle[t - 1] - 0.8 * cycle[t - 2] + shocks[t]
+    x = trend + cycle + 0.5 * rng.standard_normal((n, k))
+    return x[:, 0] if k == 1 else x
+
+
+@pytest.fixture
+def series():
+    return trend_cycle_series
@@ -0,0 +1,76 @@
+import re
+
+import numpy as np
+import pytest
+
+import tsf_wrapper
+
+
+def baseline_parse_and_sort_factors(raw_factors):
+    # The sorted-list parser this extension shipped with, kept as the reference ordering
+    from datetime import datetime
+
+    cleaned_dates = []
+    for factor in raw_factors:
+        match = re.search(r'DATE_=(.+?)\]', factor)
+        if match:
+            cleaned_dates.append(re.sub(r'\s+', ' ', match.group(1).strip()))
+
+    def is_quarter_format(date):
+        return re.match(r'^Q[1-4] \d{4}$', date)
+
+    def is_month_format(date):
+        return re.match(r'^[A-Z]{3} \d{4}$', date)
+
+    def is_weekday_format(date):
+        return re.match(r'^(\d+\s+(?:SUN|MON|TUE|WED|THU|FRI|SAT)|(?:SUN|MON|TUE|WED|THU|FRI|SAT)\s+\d+)$', date)
+
+    weekday_order = {'SUN': 0, 'MON': 1, 'TUE': 2, 'WED': 3, 'THU': 4, 'FRI': 5, 'SAT': 6}
+
+    def sort_key(date_str):
+        if is_quarter_format(date_str):
+            quarter, year = date_str.split()
+            return int(year) * 4 + (int(quarter[1]) - 1)
+        dt = datetime.strptime(date_str, "%b %Y")
+        return dt.year * 12 + dt.month
+
+    if not cleaned_dates:
+        return []
+    if all(is_weekday_format(d) for d in cleaned_dates):
+        if cleaned_dates[0].split()[0] in weekday_order:
+            return sorted(cleaned_dates, key=lambda x: (weekday_order[x.split()[0]], int(x.split()[1])))
+        return sorted(cleaned_dates, key=lambda x: (int(x.split()[0]), weekday_order[x.split()[1]]))
+    if all(is_quarter_format(d) for d in cleaned_dates) or all(is_month_format(d) for d in cleaned_dates):
+        return sorted(cleaned_dates, key=sort_key)
+    return cleaned_dates
+
+
+MONTHS = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+WEEKDAYS = ["SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT"]
+LEVELS = {
+    "quarter": [f"Q{q} {year}" for year in range(1990, 2030) for q in range(1, 5)],
+    "month": [f"{month} {year}" for year in range(1995, 2020) for month in MONTHS],
+    "weekday_first": [f"{day} {week}" for week in range(1195, 1260) for day in WEEKDAYS],
+    "number_first": [f"{week} {day}" for week in range(1, 60) for day in WEEKDAYS],
+}
+
+
+@pytest.mark.parametrize("date_format", list(LEVELS))
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_parser_matches_the_baseline_on_shuffled_levels(date_format, seed):
+    levels = np.random.default_rng(seed).permutation(LEVELS[date_format]).tolist()
+    raw_factors = [f"[DATE_={level} ]" for level in levels]
+    assert list(tsf_wrapper.parse_and_sort_factors(raw_factors)) == baseline_parse_and_sort_factors(raw_factors)
+    assert tsf_wrapper.detect_date_format(levels)[0] == date_format
+
+
+def test_weekday_levels_that_look_like_months_are_sorted():
+    levels = ["TUE 1200", "MON 1201", "MON 1200", "SUN 1300"]
+    axis = tsf_wrapper.parse_and_sort_factors([f"[DATE_={level}]" for level in levels])
+    assert list(axis) == ["SUN 1300", "MON 1200", "MON 1201", "TUE 1200"]
+
+
+def test_mixed_levels_keep_their_order():
+    levels = ["Q2 2001", "JAN 2001", "Q1 2001"]
+    raw_factors = [f"[DATE_={level}]" for level in levels]
+    assert list(tsf_wrapper.parse_and_sort_factors(raw_factors)) == baseline_parse_and_sort_factors(raw_factors)
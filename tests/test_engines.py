@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+import tsf_engines
+
+sm = pytest.importorskip("statsmodels.api")
+
+
+@pytest.mark.parametrize("n", [3, 4, 10, 200, 5000])
+@pytest.mark.parametrize("lamb", [6.25, 1600, 129600])
+def test_hp_filter_matches_statsmodels(series, n, lamb):
+    x = series(n)
+    cycle, trend = tsf_engines.hp_filter_engine(x, lamb)
+    expected_cycle, expected_trend = sm.tsa.filters.hpfilter(x, lamb)
+    np.testing.assert_allclose(trend, expected_trend, rtol=0, atol=1e-8 * np.abs(x).max())
+    np.testing.assert_allclose(cycle, expected_cycle, rtol=0, atol=1e-8 * np.abs(x).max())
+
+
+def test_hp_filter_stacked_columns_share_one_factor(series):
+    x = series(400, k=5)
+    tsf_engines._hp_factor_cache.clear()
+    cycle, trend = tsf_engines.hp_filter_engine(x, 1600)
+    assert list(tsf_engines._hp_factor_cache) == [(400, 1600.0)]
+    for i in range(x.shape[1]):
+        np.testing.assert_allclose(trend[:, i], sm.tsa.filters.hpfilter(x[:, i], 1600)[1], rtol=0, atol=1e-9)
+        np.testing.assert_allclose(cycle[:, i] + trend[:, i], x[:, i], rtol=0, atol=1e-12)
+
+
+def test_hp_filter_rejects_short_series():
+    with pytest.raises(ValueError):
+        tsf_engines.hp_filter_engine(np.arange(2.0))
+
+
+def test_hp_sweep_matches_single_lambda_runs(series):
+    x = series(300, k=2)
+    for lamb, cycle, trend in tsf_engines.hp_sweep_engine(x, [100, 1600, 14400]):
+        expected_cycle, expected_trend = tsf_engines.hp_filter_engine(x, lamb)
+        np.testing.assert_allclose(trend, expected_trend, rtol=0, atol=1e-10)
+        np.testing.assert_allclose(cycle, expected_cycle, rtol=0, atol=1e-10)
+
+
+@pytest.mark.parametrize("n", [3, 5, 40, 1000])
+@pytest.mark.parametrize("drift", [True, False])
+@pytest.mark.parametrize("low, high", [(6, 32), (2, 8), (18, 96)])
+def test_cf_filter_matches_statsmodels(series, n, drift, low, high):
+    x = series(n)
+    cycle, trend = tsf_engines.cf_filter_engine(x, low, high, drift)
+    expected_cycle, expected_trend = sm.tsa.filters.cffilter(x, low, high, drift)
+    np.testing.assert_allclose(cycle, expected_cycle, rtol=0, atol=1e-10)
+    np.testing.assert_allclose(trend, expected_trend, rtol=0, atol=1e-10)
+
+
+def test_cf_filter_stacked_columns(series):
+    x = series(250, k=3)
+    cycle, trend = tsf_engines.cf_filter_engine(x, 6, 32, True)
+    for i in range(x.shape[1]):
+        expected_cycle, expected_trend = sm.tsa.filters.cffilter(x[:, i], 6, 32, True)
+        np.testing.assert_allclose(cycle[:, i], expected_cycle, rtol=0, atol=1e-10)
+        np.testing.assert_allclose(trend[:, i], expected_trend, rtol=0, atol=1e-10)
+
+
+def test_cf_filter_rejects_low_below_two(series):
+    with pytest.raises(ValueError):
+        tsf_engines.cf_filter_engine(series(50), 1.5, 32)
+
+
+# K = 12 takes the direct sliding window product, K = 30 the FFT convolution
+@pytest.mark.parametrize("K", [1, 3, 12, 30])
+@pytest.mark.parametrize("low, high", [(6, 32), (2, 8)])
+def test_bk_filter_matches_statsmodels(series, K, low, high):
+    x = series(600)
+    cycle = tsf_engines.bk_filter_engine(x, low, high, K)
+    np.testing.assert_allclose(cycle, sm.tsa.filters.bkfilter(x, low, high, K), rtol=0, atol=1e-10)
+
+
+@pytest.mark.parametrize("K", [12, 30])
+def test_bk_filter_stacked_columns(series, K):
+    x = series(300, k=4)
+    cycle = tsf_engines.bk_filter_engine(x, 6, 32, K)
+    assert cycle.shape == (300 - 2 * K, 4)
+    for i in range(x.shape[1]):
+        np.testing.assert_allclose(cycle[:, i], sm.tsa.filters.bkfilter(x[:, i], 6, 32, K), rtol=0, atol=1e-10)
+
+
+def test_bk_filter_rejects_short_series(series):
+    with pytest.raises(ValueError):
+        tsf_engines.bk_filter_engine(series(24), 6, 32, 12)
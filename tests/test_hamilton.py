@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import tsf_engines
+
+
+def regression_cycle(x, h, p):
+    # Reference: ordinary least squares of y(t+h) on a constant and the levels y(t), ..., y(t-p+1)
+    n = len(x)
+    rows = np.arange(p - 1, n - h)
+    design = np.column_stack([np.ones(len(rows))] + [x[rows - j] for j in range(p)])
+    target = x[rows + h]
+    beta = np.linalg.lstsq(design, target, rcond=None)[0]
+    return target - design @ beta
+
+
+@pytest.mark.parametrize("h, p", [(8, 4), (24, 12), (2, 1)])
+def test_hamilton_matches_least_squares(series, h, p):
+    x = series(300)
+    cycle, trend = tsf_engines.hamilton_filter_engine(x, h, p)
+    np.testing.assert_allclose(cycle, regression_cycle(x, h, p), rtol=0, atol=1e-8)
+    np.testing.assert_allclose(cycle + trend, x[h + p - 1:], rtol=0, atol=1e-10)
+
+
+@pytest.mark.parametrize("x", [np.arange(100.0), np.full(100, 5.0), 3.0 - 0.5 * np.arange(100.0)],
+                         ids=["linear", "constant", "falling"])
+def test_hamilton_rank_deficient_columns(x):
+    # Exact linear trends and constants make the lagged differences collinear with the constant
+    cycle, trend = tsf_engines.hamilton_filter_engine(x)
+    np.testing.assert_allclose(cycle, 0, atol=1e-9)
+    np.testing.assert_allclose(trend, x[11:], rtol=0, atol=1e-9)
+
+
+def test_hamilton_singular_column_leaves_the_others_unchanged(series):
+    x = np.column_stack([series(120), np.arange(120.0), series(120, seed=1)])
+    cycle, _ = tsf_engines.hamilton_filter_engine(x)
+    np.testing.assert_allclose(cycle[:, 1], 0, atol=1e-9)
+    for i in (0, 2):
+        np.testing.assert_allclose(cycle[:, i], tsf_engines.hamilton_filter_engine(x[:, i])[0], rtol=0, atol=1e-12)
+        np.testing.assert_allclose(cycle[:, i], regression_cycle(x[:, i], 8, 4), rtol=0, atol=1e-8)
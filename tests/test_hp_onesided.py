@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import tsf_engines
+
+
+def expanding_window_trend(x, lamb):
+    # The O(n^2) reference: the last point of the two-sided HP trend of every window x[:t]
+    trend = np.empty_like(x)
+    trend[:2] = x[:2]
+    for t in range(3, len(x) + 1):
+        trend[t - 1] = tsf_engines.hp_filter_engine(x[:t], lamb)[1][-1]
+    return trend
+
+
+@pytest.mark.parametrize("lamb", [1, 100, 1600, 129600])
+def test_onesided_matches_expanding_windows(series, lamb):
+    x = series(300)
+    cycle, trend = tsf_engines.hp_onesided_engine(x, lamb)
+    expected = expanding_window_trend(x, lamb)
+    np.testing.assert_allclose(trend, expected, rtol=0, atol=1e-8 * np.abs(x).max())
+    np.testing.assert_allclose(cycle, x - expected, rtol=0, atol=1e-8 * np.abs(x).max())
+
+
+def test_onesided_stacked_columns(series):
+    x = series(200, k=3)
+    _, trend = tsf_engines.hp_onesided_engine(x, 1600)
+    for i in range(x.shape[1]):
+        np.testing.assert_allclose(trend[:, i], expanding_window_trend(x[:, i], 1600), rtol=0, atol=1e-8)
+
+
+def test_onesided_short_series():
+    # Three observations are the shortest window the two-sided filter accepts
+    x = np.array([1.0, 3.0, 2.0])
+    np.testing.assert_allclose(tsf_engines.hp_onesided_engine(x, 1600)[1], expanding_window_trend(x, 1600))
+    with pytest.raises(ValueError):
+        tsf_engines.hp_onesided_engine(x[:2], 1600)
+
+
+def test_onesided_sweep_uses_onesided_trend(series):
+    x = series(120, k=2)
+    for lamb, cycle, trend in tsf_engines.hp_sweep_engine(x, [100, 1600], one_sided=True):
+        np.testing.assert_allclose(trend, tsf_engines.hp_onesided_engine(x, lamb)[1], rtol=0, atol=1e-12)
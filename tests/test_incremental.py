@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+import tsf_engines
+
+
+def assert_parts_close(actual, expected, atol):
+    actual = actual if isinstance(actual, tuple) else (actual,)
+    expected = expected if isinstance(expected, tuple) else (expected,)
+    assert len(actual) == len(expected)
+    for actual_part, expected_part in zip(actual, expected):
+        assert actual_part.shape == expected_part.shape
+        np.testing.assert_allclose(actual_part, expected_part, rtol=0, atol=atol)
+
+
+# Rows already filtered before the update: fewer than the tail window (full recompute), a long
+# saved prefix with a few or many appended rows, and no appended rows at all
+@pytest.mark.parametrize("rows", [5, 300, 590, 599, 600])
+@pytest.mark.parametrize("lamb", [100, 1600, 14400])
+def test_hp_tail_update_matches_full_recompute(series, rows, lamb):
+    x = series(600)
+    saved = tsf_engines.hp_filter_engine(x[:rows], lamb)
+    assert_parts_close(tsf_engines.hp_tail_update(x, rows, saved, lamb), tsf_engines.hp_filter_engine(x, lamb),
+                       atol=1e-9)
+
+
+def test_hp_tail_update_stacked_columns(series):
+    x = series(500, k=3)
+    saved = tsf_engines.hp_filter_engine(x[:480], 1600)
+    assert_parts_close(tsf_engines.hp_tail_update(x, 480, saved, 1600), tsf_engines.hp_filter_engine(x, 1600),
+                       atol=1e-9)
+
+
+# Updates that resume inside the transient of the Kalman gains and in the steady state
+@pytest.mark.parametrize("rows", [1, 2, 3, 10, 150, 399, 400])
+@pytest.mark.parametrize("lamb", [1, 1600])
+def test_hp_onesided_update_matches_full_recompute(series, rows, lamb):
+    x = series(400)
+    saved = tsf_engines.hp_onesided_engine(x[:rows], lamb) if rows >= 3 else None
+    assert_parts_close(tsf_engines.hp_onesided_update(x, rows, saved, lamb),
+                       tsf_engines.hp_onesided_engine(x, lamb), atol=1e-9)
+
+
+@pytest.mark.parametrize("rows", [10, 25, 26, 200, 299, 300])
+@pytest.mark.parametrize("K", [12, 30])
+def test_bk_tail_update_matches_full_recompute(series, rows, K):
+    x = series(300, k=2)
+    saved = (tsf_engines.bk_filter_engine(x[:rows], 6, 32, K),) if rows > 2 * K else None
+    assert_parts_close(tsf_engines.bk_tail_update(x, rows, saved, 6, 32, K),
+                       tsf_engines.bk_filter_engine(x, 6, 32, K), atol=1e-12)
+
+
+def run_saved(data, settings):
+    # Runs execute() on the host stand-ins and returns the saved variables and the notes
+    from wrapper import basewrapper
+    import tsf_wrapper
+
+    names = [f"y{j}" for j in range(data.shape[1])]
+    data_model = {"fields": [{"name": name} for name in names] + [{"name": "DATE_"}],
+                  "records": [list(row) + [str(i + 1)] for i, row in enumerate(data.tolist())]}
+    saved = []
+    basewrapper.outputs.clear()
+    tsf_wrapper.execute(0, data_model, dict(settings, hpvariable=names, bk_cf_variables=names),
+                        save_output=saved.append)
+    items = basewrapper.outputs[-1][0]["items"]
+    assert not [item for item in items if item["type"] == "warnings"]
+    columns = {field["name"]: saved[0]["data"][:, i] for i, field in enumerate(saved[0]["fields"])}
+    return columns, {item["title"]: item["text"] for item in items if item["type"] == "notes"}
+
+
+@pytest.mark.parametrize("one_sided", [False, True])
+def test_incremental_option_matches_full_run(series, tmp_path, one_sided):
+    # A run on the history followed by a run on the appended rows saves what a full run saves
+    x = series(400, k=2)
+    settings = {"hpfilter": True, "bkfilter": True, "cffilter": True, "hamiltonfilter": True, "k": 12,
+                "hp_one_sided": one_sided, "no_plots": True, "filter_threads": 1}
+    incremental = dict(settings, incremental=True, cache_directory=str(tmp_path))
+
+    run_saved(x[:380], incremental)
+    updated, notes = run_saved(x, incremental)
+    expected, _ = run_saved(x, settings)
+
+    # HP, Hamilton, BK and CF for each of the two variables, 20 appended rows each
+    assert notes["Incremental Update"].startswith("8 series were updated from their saved state with 160 new rows")
+    assert updated.keys() == expected.keys()
+    for name in expected:
+        np.testing.assert_allclose(updated[name], expected[name], rtol=0, atol=1e-9, err_msg=name)
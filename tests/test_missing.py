@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+import tsf_engines
+import tsf_wrapper
+
+
+def test_handle_missing_trims_and_interpolates():
+    column = np.array([np.nan, 1.0, 2.0, np.nan, 6.0, np.nan])
+    start, values, mask = tsf_wrapper.handle_missing(column)
+    assert start == 1
+    np.testing.assert_array_equal(values, [1.0, 2.0, 4.0, 6.0])
+    np.testing.assert_array_equal(mask, [False, False, True, False])
+    with pytest.raises(ValueError):
+        tsf_wrapper.handle_missing(column, "reject")
+
+
+def run_with_gap(series, settings):
+    from wrapper import basewrapper
+
+    x = series(120, k=2)
+    x[40, 0] = np.nan
+    names = ["y0", "y1"]
+    data_model = {"fields": [{"name": name} for name in names] + [{"name": "DATE_"}],
+                  "records": [[None if np.isnan(v) else v for v in row] + [str(i + 1)] for i, row in enumerate(x)]}
+    saved = []
+    basewrapper.outputs.clear()
+    tsf_wrapper.execute(0, data_model, dict(settings, hpvariable=names, bk_cf_variables=names),
+                        save_output=saved.append)
+    items = basewrapper.outputs[-1][0]["items"]
+    columns = {field["name"]: saved[0]["data"][:, i] for i, field in enumerate(saved[0]["fields"])} if saved else {}
+    return x, columns, [item["text"] for item in items if item["type"] == "warnings"]
+
+
+def test_interior_gap_is_interpolated_by_default(series):
+    # An interior gap no longer stops HP and CF; the filters see the linearly interpolated column
+    settings = {"hpfilter": True, "cffilter": True, "no_plots": True}
+    x, columns, warnings = run_with_gap(series, settings)
+    assert not warnings
+    filled = x[:, 0].copy()
+    filled[40] = (filled[39] + filled[41]) / 2
+    np.testing.assert_allclose(columns["y0_hp_cycle"], tsf_engines.hp_filter_engine(filled, 1600)[0], atol=1e-9)
+    np.testing.assert_allclose(columns["y0_cf_cycle"], tsf_engines.cf_filter_engine(filled, 6, 32, True)[0],
+                               atol=1e-9)
+
+
+def test_reject_keeps_the_error(series):
+    settings = {"hpfilter": True, "missing_method": "reject", "no_plots": True}
+    _, columns, warnings = run_with_gap(series, settings)
+    assert warnings and "y0" in warnings[0]
+
+
+def test_mask_applies_to_the_lambda_sweep(series):
+    settings = {"hpfilter": True, "lamb": [100, 1600], "missing_mask": True, "no_plots": True}
+    _, columns, warnings = run_with_gap(series, settings)
+    assert not warnings
+    for name in ("y0_hp100_cycle", "y0_hp100_trend", "y0_hp1600_cycle", "y0_hp1600_trend"):
+        assert np.flatnonzero(np.isnan(columns[name])).tolist() == [40]
+    assert not np.isnan(columns["y1_hp1600_cycle"]).any()
+
+
+def run_panel(x, ids, settings):
+    from wrapper import basewrapper
+
+    names = [f"y{j}" for j in range(x.shape[1])]
+    data_model = {"fields": [{"name": name} for name in names] + [{"name": "DATE_"}, {"name": "region"}],
+                  "records": [[None if np.isnan(v) else v for v in row] + [str(i + 1), ids[i]]
+                              for i, row in enumerate(x)]}
+    saved = []
+    basewrapper.outputs.clear()
+    tsf_wrapper.execute(0, data_model, dict(settings, hpvariable=names, bk_cf_variables=names, panel_variable="region",
+                                            panel_workers=1, no_plots=True),
+                        save_output=saved.append)
+    items = basewrapper.outputs[-1][0]["items"]
+    assert not [item["text"] for item in items if item["type"] == "warnings"]
+    return {field["name"]: saved[0]["data"][:, i] for i, field in enumerate(saved[0]["fields"])}
+
+
+def test_panel_groups_interpolate_gaps_and_skip_missing_ids(series):
+    x = series(240, k=2)
+    ids = ["NE" if i % 2 else "SW" for i in range(240)]
+    ids[7] = None
+    x[100, 0] = np.nan
+    x[:2, 1] = np.nan
+    columns = run_panel(x, ids, {"hpfilter": True, "cffilter": True})
+
+    for region in ("NE", "SW"):
+        rows = np.array([i for i in range(240) if ids[i] == region])
+        for j in range(2):
+            start, values, _ = tsf_wrapper.handle_missing(x[rows, j])
+            hp_cycle = tsf_engines.hp_filter_engine(values, 1600)[0]
+            np.testing.assert_allclose(columns[f"y{j}_hp_cycle"][rows[start:]], hp_cycle, atol=1e-9)
+            cf_cycle = tsf_engines.cf_filter_engine(values, 6, 32, True)[0]
+            np.testing.assert_allclose(columns[f"y{j}_cf_cycle"][rows[start:]], cf_cycle, atol=1e-9)
+            assert np.isnan(columns[f"y{j}_hp_cycle"][rows[:start]]).all()
+    assert np.isnan(columns["y0_hp_cycle"][7]) and np.isnan(columns["y1_cf_cycle"][7])
+
+
+def test_panel_dry_run_reports_the_plan_without_filtering(series):
+    from wrapper import basewrapper
+
+    x = series(120, k=2)
+    data_model = {"fields": [{"name": "y0"}, {"name": "y1"}, {"name": "DATE_"}, {"name": "region"}],
+                  "records": [list(row) + [str(i + 1), "NE" if i % 2 else "SW"] for i, row in enumerate(x)]}
+    saved = []
+    basewrapper.outputs.clear()
+    tsf_wrapper.execute(0, data_model, {"hpfilter": True, "hpvariable": ["y0"], "panel_variable": "region",
+                                        "panel_workers": 1, "dry_run": True}, save_output=saved.append)
+    items = basewrapper.outputs[-1][0]["items"]
+    assert not saved
+    assert [item["type"] for item in items if item["type"] in ("table", "chart")] == ["table"]
+
+
+def test_tables_fall_back_to_text_notes(series, monkeypatch):
+    # Hosts whose util.statjson has no pivot tables get the sweep as a fixed width text note
+    monkeypatch.setattr(tsf_wrapper, "PIVOT_TABLES", False)
+    from wrapper import basewrapper
+
+    run_with_gap(series, {"hpfilter": True, "lamb": [100, 1600], "no_plots": True})
+    items = basewrapper.outputs[-1][0]["items"]
+    assert not [item for item in items if item["type"] == "table"]
+    text = [item["text"] for item in items if item["type"] == "notes" and "Sweep" in item["title"]][0]
+    lines = text.splitlines()
+    assert len(lines) == 6 and lines[2].split()[:2] == ["y0", "100"]
+
+
+def test_lambda_range_sweeps_log_spaced_values(series):
+    settings = {"hpfilter": True, "lamb_range": [100, 14400, 3], "no_plots": True}
+    _, columns, warnings = run_with_gap(series, settings)
+    assert not warnings
+    assert sorted({name.split("_")[1] for name in columns}) == ["hp100", "hp1200", "hp14400"]
+
+
+def test_panel_rejects_a_lambda_list(series):
+    from wrapper import basewrapper
+
+    x = series(120, k=1).reshape(120, 1)
+    data_model = {"fields": [{"name": "y0"}, {"name": "DATE_"}, {"name": "region"}],
+                  "records": [list(row) + [str(i + 1), "NE" if i % 2 else "SW"] for i, row in enumerate(x)]}
+    basewrapper.outputs.clear()
+    tsf_wrapper.execute(0, data_model, {"hpfilter": True, "hpvariable": ["y0"], "lamb": [100, 1600],
+                                        "panel_variable": "region", "panel_workers": 1, "no_plots": True})
+    items = basewrapper.outputs[-1][0]["items"]
+    assert ["PANEL" in item["text"] for item in items if item["type"] == "warnings"] == [True]